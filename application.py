@@ -1,23 +1,36 @@
 # application.py
+import json
 import os
 
 import dash
-from dash import dcc, html, no_update
+from dash import dcc, html
 from dash.dependencies import Input, Output, State
-from flask import Flask
-from flask_caching import Cache
-
-from src.data import (
-    data,
-    filter_data,
-    prepare_radar_data,
-    prepare_scatter_plot,
-    prepare_stacked_bar_chart,
-    prepare_state_data,
-    prepare_treemap_data,
+from flask import Flask, Response
+
+from src.background import (
+    JobManager,
+    answer_cached,
+    background_job,
+    report_progress,
+)
+from src.cache import (
+    as_json,
+    cache,
+    memoize,
+    prepare_radar_data_cached,
+    prepare_scatter_plot_cached,
+    prepare_stacked_bar_chart_cached,
+    prepare_state_data_cached,
+    prepare_treemap_data_cached,
 )
-from src.layouts import main_layout
+from src.data import filter_data, refresh_state
+from src.filters import FilterSpec, relayout_range
+from src.layouts import main_layout, progress_hidden, progress_shown
 from src.mappings import dropdown_options_rev
+from src.metrics import metrics_text, reset_metrics, track_requests
+from src.prefetch import prefetch_next_views
+from src.profiling import profile_requests
+from src.serve import serve
 from src.visualizations import (
     create_map,
     create_radar_chart,
@@ -25,12 +38,21 @@ from src.visualizations import (
     create_splom,
     create_stacked_bar_chart,
     create_treemap,
+    patch_figure,
+    trace_names,
 )
+from src.warmup import init_warmup
 
 application = Flask(__name__)
-cache = Cache(
-    application, config={"CACHE_TYPE": "SimpleCache"}
-) 
+cache.init_app(application)
+application.before_request(refresh_state)
+track_requests(application)
+
+
+@application.route("/metrics")
+def metrics():
+    return Response(metrics_text(), mimetype="text/plain; version=0.0.4")
+
 
 app = dash.Dash(
     __name__,
@@ -39,82 +61,76 @@ app = dash.Dash(
     update_title="Updating data...",
 )
 app.layout = main_layout
-
-
-@app.callback(
-    [Output("kpi-select-container", "style")],
-    [Input("tabs", "value")],
+profile_requests(app)
+
+
+# Callbacks that only reshape what the browser already has run there, so that they
+# cost no request to the server
+app.clientside_callback(
+    """
+    function (tabName) {
+        return {display: tabName === "state_analysis_tab" ? "block" : "none"};
+    }
+    """,
+    Output("kpi-select-container", "style"),
+    Input("tabs", "value"),
 )
-def update_left_menu_visibility(tab_name):
-    if tab_name == "state_analysis_tab":
-        return [{"display": "block"}]
-
-    elif tab_name == "metric_analysis_tab":
-        return [{"display": "none"}]
-
-    return [{"display": "none"}]
-
-
-@cache.memoize(timeout=600)  # Cache result for 10 minutes
-def filter_data_cached(df, start_date, end_date, incident_types):
-    return filter_data(df, start_date, end_date, incident_types)
-
 
-@cache.memoize(timeout=600)  # Cache result for 10 minutes
-def prepare_scatter_plot_cached(df, state_code):
-    return prepare_scatter_plot(df, state_code)
-
-
-@cache.memoize(timeout=600)  # Cache result for 10 minutes
-def prepare_treemap_data_cached(df, state_code, selected_kpi):
-    return prepare_treemap_data(df, state_code, selected_kpi)
-
-
-@cache.memoize(timeout=600)  # Cache result for 10 minutes
-def prepare_stacked_bar_chart_cached(df, state_code):
-    return prepare_stacked_bar_chart(df, state_code)
-
-
-@cache.memoize(timeout=600)  # Cache result for 10 minutes
-def prepare_radar_data_cached(df, dropdown_state):
-    return prepare_radar_data(df, dropdown_state)
-
-
-@cache.memoize(timeout=600)  # Cache result for 10 minutes
-def prepare_state_data_cached(df, kpi):
-    return prepare_state_data(df, kpi)
-
-
-@app.callback(
+app.clientside_callback(
+    """
+    function (clickData, currentState) {
+        // The state clicked on the map, unless it already is the selected one
+        if (!clickData || clickData.points[0].location === currentState) {
+            return window.dash_clientside.no_update;
+        }
+        return clickData.points[0].location;
+    }
+    """,
     Output("state-dropdown", "value"),
-    [Input("map-container", "clickData")],
-    [State("state-dropdown", "value")],
+    Input("map-container", "clickData"),
+    State("state-dropdown", "value"),
 )
-def update_selected_state(click_data, current_state):
-    print(">>> update_selected_state triggered")
-    if click_data:
-        clicked_state = click_data["points"][0]["location"]  # Get clicked state
-        return current_state if clicked_state == current_state else clicked_state
-    return current_state  # Retain the current state if no new click
-
 
-@app.callback(
+app.clientside_callback(
+    f"""
+    function (clickData) {{
+        // The KPI of the clicked axis of the radar chart
+        const kpis = {json.dumps(dropdown_options_rev)};
+        const kpi = clickData && clickData.points && kpis[clickData.points[0].theta];
+        return kpi || window.dash_clientside.no_update;
+    }}
+    """,
     Output("kpi-select-dropdown", "value"),
     Input("radar-chart", "clickData"),
 )
-def update_on_radar_click(click_data):
-    print(">>> update_on_radar_click triggered")
-    return (
-        dropdown_options_rev.get(click_data["points"][0]["theta"], no_update)
-        if click_data and "points" in click_data
-        else no_update
-    )
 
+# The metric analysis charts are drawn anew, without selections
+app.clientside_callback(
+    """
+    function () {
+        return {};
+    }
+    """,
+    Output("crossfilter-selection", "data", allow_duplicate=True),
+    Input("tabs", "value"),
+    Input("date-picker-range", "start_date"),
+    Input("date-picker-range", "end_date"),
+    Input("incident-filter-dropdown", "value"),
+    Input("state-dropdown", "value"),
+    prevent_initial_call=True,
+)
 
+
+# The linked charts of the metric analysis tab write their figures straight into the
+# graphs, so that a zoom or click takes a single request. They send patches of the
+# trace arrays; the stacked bar chart is only redrawn whole when its establishment
+# types change, and keeps their names in a store to tell
 @app.callback(
     [
-        Output("store-treemap2", "data"),
-        Output("store-bar2", "data"),
+        Output("treemap-chart", "figure", allow_duplicate=True),
+        Output("stacked-bar-chart", "figure", allow_duplicate=True),
+        Output("crossfilter-selection", "data", allow_duplicate=True),
+        Output("stacked-bar-traces", "data", allow_duplicate=True),
     ],
     [
         Input("scatter-plot", "relayoutData"),
@@ -123,10 +139,13 @@ def update_on_radar_click(click_data):
         State("incident-filter-dropdown", "value"),
         State("kpi-select-dropdown", "value"),
         State("state-dropdown", "value"),
+        State("crossfilter-selection", "data"),
+        State("stacked-bar-traces", "data"),
     ],
     prevent_initial_call=True,
+    running=[(Output("chart-progress", "style"), progress_shown, progress_hidden)],
 )
-@cache.memoize(timeout=600)  # Cache result for 10 minutes
+@memoize()
 def update_dependent_charts(
     scatter_relayoutData,
     start_date,
@@ -134,64 +153,44 @@ def update_dependent_charts(
     incident_types,
     kpi,
     dropdown_state,
+    selection,
+    bar_traces,
 ):
-    print(">>> update_dependent_charts triggered")
-
     if not scatter_relayoutData or "autosize" in scatter_relayoutData:
-        print(">>> Preventing update_dependent_charts due to insufficient relayoutData")
         raise dash.exceptions.PreventUpdate
 
-    # Re-filter data based on date and incident filters
-    filtered_data = filter_data_cached(data, start_date, end_date, incident_types)
-
-    # If zoom info is available, further filter the data
-    if scatter_relayoutData:
-        x_min = scatter_relayoutData.get("xaxis.range[0]", None)
-        x_max = scatter_relayoutData.get("xaxis.range[1]", None)
-        y_min = scatter_relayoutData.get("yaxis.range[0]", None)
-        y_max = scatter_relayoutData.get("yaxis.range[1]", None)
-        if x_min is not None and x_max is not None:
-            filtered_data = filtered_data[
-                (
-                    filtered_data["time_started_work"].dt.hour
-                    + filtered_data["time_started_work"].dt.minute / 60
-                    >= float(x_min)
-                )
-                & (
-                    filtered_data["time_started_work"].dt.hour
-                    + filtered_data["time_started_work"].dt.minute / 60
-                    <= float(x_max)
-                )
-            ]
-        if y_min is not None and y_max is not None:
-            filtered_data = filtered_data[
-                (
-                    filtered_data["time_of_incident"].dt.hour
-                    + filtered_data["time_of_incident"].dt.minute / 60
-                    >= float(y_min)
-                )
-                & (
-                    filtered_data["time_of_incident"].dt.hour
-                    + filtered_data["time_of_incident"].dt.minute / 60
-                    <= float(y_max)
-                )
-            ]
+    # The zoomed time ranges replace the previous ones; the other selections stay
+    selection = {
+        **(selection or {}),
+        "time_started_work": relayout_range(scatter_relayoutData, "xaxis"),
+        "time_of_incident": relayout_range(scatter_relayoutData, "yaxis"),
+    }
+    spec = FilterSpec.from_inputs(
+        start_date, end_date, incident_types, state=dropdown_state
+    )
 
     # Prepare data and figures for treemap and stacked bar chart
-    treemap_data = prepare_treemap_data_cached(filtered_data, dropdown_state, kpi)
-    stacked_bar_data = prepare_stacked_bar_chart_cached(filtered_data, dropdown_state)
+    treemap_data = prepare_treemap_data_cached(
+        spec.for_view(selection, "treemap")._replace(kpi=kpi)
+    )
+    stacked_bar_data = prepare_stacked_bar_chart_cached(spec.for_view(selection, "bar"))
 
     treemap_fig = create_treemap(treemap_data, "incident_rate", dropdown_state)
     stacked_bar_fig = create_stacked_bar_chart(stacked_bar_data, dropdown_state)
 
-    return treemap_fig, stacked_bar_fig
+    return (
+        patch_figure(treemap_fig),
+        patch_figure(stacked_bar_fig, bar_traces),
+        selection,
+        trace_names(stacked_bar_fig),
+    )
 
 
 @app.callback(
     [
-        Output("store-treemap1", "data"),
-        Output("store-scatter1", "data"),
-        Output("bar-selected-data", "data"),
+        Output("treemap-chart", "figure", allow_duplicate=True),
+        Output("scatter-plot", "figure", allow_duplicate=True),
+        Output("crossfilter-selection", "data", allow_duplicate=True),
     ],
     [
         Input("stacked-bar-chart", "clickData"),
@@ -200,11 +199,12 @@ def update_dependent_charts(
         State("incident-filter-dropdown", "value"),
         State("kpi-select-dropdown", "value"),
         State("state-dropdown", "value"),
-        State("bar-selected-data", "data"),
+        State("crossfilter-selection", "data"),
     ],
     prevent_initial_call=True,
+    running=[(Output("chart-progress", "style"), progress_shown, progress_hidden)],
 )
-@cache.memoize(timeout=600)  # Cache result for 10 minutes
+@memoize()
 def update_graphs_on_barchart_click(
     barchart_clickData,
     start_date,
@@ -212,51 +212,46 @@ def update_graphs_on_barchart_click(
     incident_types,
     kpi,
     selected_state,
-    selected_data,
+    selection,
 ):
-    print(">>> update_graphs_on_barchart_click triggered")
-
     if not barchart_clickData:
-        print(">>> Preventing update_graphs_on_barchart_click due to no clickData")
         raise dash.exceptions.PreventUpdate
 
-    # Filter data based on the date range and incident types
-    filtered_data = filter_data_cached(data, start_date, end_date, incident_types)
-
     # Handle filtering based on the clicked bar
+    selection = dict(selection or {})
     new_outcome = None
     if "points" in barchart_clickData:
         clicked_outcome = barchart_clickData["points"][0]["y"]  # Incident outcome
 
-        # Check if the same outcome was clicked consecutively
-        if selected_data == clicked_outcome:
-            print(
-                ">>> Resetting incident_outcome filter due to double-click or same point click"
-            )
+        # Clicking the selected outcome again, or double-clicking it, clears it
+        if selection.get("incident_outcome") == clicked_outcome:
             new_outcome = None
         else:
-            print(clicked_outcome)
-            filtered_data = filtered_data[
-                filtered_data["incident_outcome"] == clicked_outcome
-            ]
             new_outcome = clicked_outcome  # Update the last clicked outcome
+    selection["incident_outcome"] = new_outcome
+
+    spec = FilterSpec.from_inputs(
+        start_date, end_date, incident_types, state=selected_state
+    )
 
     # Prepare data and figures for treemap and scatter plot
     treemap_data = prepare_treemap_data_cached(
-        filtered_data, selected_state, "incident_rate"
+        spec.for_view(selection, "treemap")._replace(kpi="incident_rate")
     )
-    scatter_plot_data = prepare_scatter_plot_cached(filtered_data, selected_state)
+    scatter_plot_data = prepare_scatter_plot_cached(spec.for_view(selection, "scatter"))
 
     treemap_fig = create_treemap(treemap_data, "incident_rate", selected_state)
     scatter_plot_fig = create_scatter_plot(scatter_plot_data, selected_state)
 
-    return treemap_fig, scatter_plot_fig, new_outcome
+    return patch_figure(treemap_fig), patch_figure(scatter_plot_fig), selection
 
 
 @app.callback(
     [
-        Output("store-bar1", "data"),
-        Output("store-scatter2", "data"),
+        Output("stacked-bar-chart", "figure", allow_duplicate=True),
+        Output("scatter-plot", "figure", allow_duplicate=True),
+        Output("crossfilter-selection", "data", allow_duplicate=True),
+        Output("stacked-bar-traces", "data", allow_duplicate=True),
     ],
     [
         Input("treemap-chart", "clickData"),
@@ -267,10 +262,13 @@ def update_graphs_on_barchart_click(
         State("incident-filter-dropdown", "value"),
         State("kpi-select-dropdown", "value"),
         State("state-dropdown", "value"),
+        State("crossfilter-selection", "data"),
+        State("stacked-bar-traces", "data"),
     ],
     prevent_initial_call=True,
+    running=[(Output("chart-progress", "style"), progress_shown, progress_hidden)],
 )
-@cache.memoize(timeout=600)  # Cache result for 10 minutes
+@memoize()
 def update_graphs_with_treemap_click(
     treemap_clickData,
     start_date,
@@ -278,106 +276,56 @@ def update_graphs_with_treemap_click(
     incident_types,
     kpi,
     selected_state,
+    selection,
+    bar_traces,
 ):
-    print(">>> update_graphs_with_treemap_click triggered")
     if not treemap_clickData:
-        print(">>> Preventing update_graphs_with_treemap_click due to no clickData")
         raise dash.exceptions.PreventUpdate
 
-    # Filter data based on the date range and incident types
-    filtered_data = filter_data_cached(data, start_date, end_date, incident_types)
-
-    # If a region on the treemap was clicked, further filter by the clicked region
+    # The clicked region replaces the previous one; the root clears it
+    selection = {
+        **(selection or {}),
+        "soc_description_1": None,
+        "soc_description_2": None,
+    }
     if "points" in treemap_clickData:
-        print(treemap_clickData)
         clicked_label = treemap_clickData["points"][0]["label"]  # Get clicked label
         clicked_parent = treemap_clickData["points"][0].get(
             "parent", None
         )  # Get parent label if present
         # Filter data based on the clicked region
         if clicked_parent and clicked_parent != "US Market":
-            filtered_data = filtered_data[
-                (filtered_data["soc_description_1"] == clicked_parent)
-                & (filtered_data["soc_description_2"] == clicked_label)
-            ]
+            selection["soc_description_1"] = clicked_parent
+            selection["soc_description_2"] = clicked_label
         elif clicked_label != "US Market":
-            filtered_data = filtered_data[
-                (filtered_data["soc_description_1"] == clicked_label)
-            ]
+            selection["soc_description_1"] = clicked_label
+
+    spec = FilterSpec.from_inputs(
+        start_date, end_date, incident_types, state=selected_state
+    )
 
     # Prepare data and figures for stacked bar chart and scatter plot
-    stacked_bar_data = prepare_stacked_bar_chart_cached(filtered_data, selected_state)
-    scatter_plot_data = prepare_scatter_plot_cached(filtered_data, selected_state)
+    stacked_bar_data = prepare_stacked_bar_chart_cached(spec.for_view(selection, "bar"))
+    scatter_plot_data = prepare_scatter_plot_cached(spec.for_view(selection, "scatter"))
 
     stacked_bar_fig = create_stacked_bar_chart(stacked_bar_data, selected_state)
     scatter_plot_fig = create_scatter_plot(scatter_plot_data, selected_state)
 
-    return stacked_bar_fig, scatter_plot_fig
-
-
-@app.callback(
-    Output("stacked-bar-chart", "figure"),
-    Input("store-bar1", "data"),
-    Input("store-bar2", "data"),
-    prevent_initial_call=True,
-)
-def update_stacked_bar_figure(bar_figure_dict1, bar_figure_dict2):
-    print(">>> update_stacked_bar_figure triggered")
-    if bar_figure_dict1 is None and bar_figure_dict2 is None:
-        print(">>> Preventing update_stacked_bar_figure due to None data")
-        raise dash.exceptions.PreventUpdate
-    return bar_figure_dict1 if bar_figure_dict1 is not None else bar_figure_dict2
-
-
-@app.callback(
-    Output("scatter-plot", "figure"),
-    Input("store-scatter1", "data"),
-    Input("store-scatter2", "data"),
-    prevent_initial_call=True,
-)
-def update_scatter_figure(scatter_figure_dict1, scatter_figure_dict2):
-    print(">>> update_scatter_figure triggered")
-    if scatter_figure_dict1 is None and scatter_figure_dict2 is None:
-        print(">>> Preventing update_scatter_figure due to None data")
-        raise dash.exceptions.PreventUpdate
     return (
-        scatter_figure_dict1
-        if scatter_figure_dict1 is not None
-        else scatter_figure_dict2
+        patch_figure(stacked_bar_fig, bar_traces),
+        patch_figure(scatter_plot_fig),
+        selection,
+        trace_names(stacked_bar_fig),
     )
 
 
-@app.callback(
-    Output("treemap-chart", "figure"),
-    Input("store-treemap1", "data"),
-    Input("store-treemap2", "data"),
-    prevent_initial_call=True,
-)
-def update_treemap_figure(treemap_figure_dict1, treemap_figure_dict2):
-    print(">>> update_treemap_figure triggered")
-    if treemap_figure_dict1 is None and treemap_figure_dict2 is None:
-        print(">>> Preventing update_treemap_figure due to None data")
-        raise dash.exceptions.PreventUpdate
-    return (
-        treemap_figure_dict1
-        if treemap_figure_dict1 is not None
-        else treemap_figure_dict2
-    )
+# Steps of compute_tab_contents shown by the progress bar of its background job
+tab_steps = 4
 
 
-@app.callback(
-    [Output("content", "children"), Output("content-metric-analysis", "children")],
-    [
-        Input("tabs", "value"),
-        Input("date-picker-range", "start_date"),
-        Input("date-picker-range", "end_date"),
-        Input("incident-filter-dropdown", "value"),
-        Input("kpi-select-dropdown", "value"),
-        Input("state-dropdown", "value"),
-    ],
-)
-@cache.memoize(timeout=600)  # Cache result for 10 minutes
-def update_tab_contents(
+@memoize(prefetched=True)
+@as_json
+def compute_tab_contents(
     tab_name,
     start_date,
     end_date,
@@ -385,11 +333,10 @@ def update_tab_contents(
     kpi,
     dropdown_state,
 ):
-    print(">>> update_tab_contents triggered")
-    filtered_data = filter_data_cached(data, start_date, end_date, incident_types)
+    spec = FilterSpec.from_inputs(start_date, end_date, incident_types)
     metric_analysis_content = html.Div()
     state_analysis_content = html.Div()
-    if filtered_data.empty:
+    if filter_data(spec).empty:
         return html.Div(
             html.H2(
                 "No data for filters. Try to change the filters or refresh the page to reset them",
@@ -401,10 +348,15 @@ def update_tab_contents(
                 style={"margin": "1em 2em"},
             )
         )
+    report_progress(1, tab_steps)
     if tab_name == "state_analysis_tab" and start_date and end_date:
-        map_data = prepare_state_data_cached(filtered_data, kpi)
+        map_data = prepare_state_data_cached(spec._replace(kpi=kpi))
+        report_progress(2, tab_steps)
 
-        radar_chart_data = prepare_radar_data_cached(filtered_data, dropdown_state)
+        radar_chart_data = prepare_radar_data_cached(
+            spec._replace(state=dropdown_state)
+        )
+        report_progress(3, tab_steps)
 
         state_analysis_content = html.Div(
             style={
@@ -428,30 +380,20 @@ def update_tab_contents(
                                 "padding": "5px",
                             },
                             children=[
-                                dcc.Loading(
-                                    children=[
-                                        dcc.Graph(
-                                            figure=create_radar_chart(
-                                                radar_chart_data, dropdown_state
-                                            ),
-                                            id="radar-chart",
-                                        ),
-                                    ]
+                                dcc.Graph(
+                                    figure=create_radar_chart(
+                                        radar_chart_data, dropdown_state
+                                    ),
+                                    id="radar-chart",
                                 )
                             ],
                         ),
                         html.Div(
                             style={"width": "50%", "padding": "5px"},
                             children=[
-                                dcc.Loading(
-                                    children=[
-                                        dcc.Graph(
-                                            figure=create_map(
-                                                map_data, kpi, dropdown_state
-                                            ),
-                                            id="map-container",
-                                        ),
-                                    ]
+                                dcc.Graph(
+                                    figure=create_map(map_data, kpi, dropdown_state),
+                                    id="map-container",
                                 )
                             ],
                         ),
@@ -466,13 +408,9 @@ def update_tab_contents(
                         "flex": "1",
                     },
                     children=[
-                        dcc.Loading(
-                            children=[
-                                dcc.Graph(
-                                    figure=create_splom(map_data, kpi, dropdown_state),
-                                    id="splom-container",
-                                )
-                            ],
+                        dcc.Graph(
+                            figure=create_splom(map_data, kpi, dropdown_state),
+                            id="splom-container",
                         )
                     ],
                 ),
@@ -480,18 +418,15 @@ def update_tab_contents(
         )
 
     if tab_name == "metric_analysis_tab":
-        scatter_plot_data = prepare_scatter_plot_cached(
-            filtered_data,
-            dropdown_state,
-        )
+        state_spec = spec._replace(state=dropdown_state)
+        scatter_plot_data = prepare_scatter_plot_cached(state_spec)
+        report_progress(2, tab_steps)
         treemap_data = prepare_treemap_data_cached(
-            filtered_data,
-            dropdown_state,
-            "incident_rate",
-        )
-        stacked_bar_chart = prepare_stacked_bar_chart_cached(
-            filtered_data, dropdown_state
+            state_spec._replace(kpi="incident_rate")
         )
+        report_progress(3, tab_steps)
+        stacked_bar_chart = prepare_stacked_bar_chart_cached(state_spec)
+        stacked_bar_fig = create_stacked_bar_chart(stacked_bar_chart, dropdown_state)
         metric_analysis_content = html.Div(
             style={
                 "display": "flex",
@@ -502,6 +437,7 @@ def update_tab_contents(
                 "height": "calc(100vh - 8rem - 40px)",
             },
             children=[
+                dcc.Store(id="stacked-bar-traces", data=trace_names(stacked_bar_fig)),
                 html.Div(
                     style={
                         "display": "grid",
@@ -513,32 +449,24 @@ def update_tab_contents(
                     children=[
                         # First Graph: Spanning from [0,0] to [1,1]
                         html.Div(
-                            dcc.Loading(
-                                children=[
-                                    dcc.Graph(
-                                        figure=create_scatter_plot(
-                                            scatter_plot_data,
-                                            dropdown_state,
-                                        ),
-                                        id="scatter-plot",
-                                        style={"height": "100%", "width": "100%"},
-                                    )
-                                ]
+                            dcc.Graph(
+                                figure=create_scatter_plot(
+                                    scatter_plot_data,
+                                    dropdown_state,
+                                ),
+                                id="scatter-plot",
+                                style={"height": "100%", "width": "100%"},
                             ),
                         ),
                         # Second Graph: Spanning [2,0] to [2,2]
                         html.Div(
-                            dcc.Loading(
-                                children=[
-                                    dcc.Graph(
-                                        figure=create_treemap(
-                                            treemap_data,
-                                            "incident_rate",
-                                            dropdown_state,
-                                        ),
-                                        id="treemap-chart",
-                                    )
-                                ]
+                            dcc.Graph(
+                                figure=create_treemap(
+                                    treemap_data,
+                                    "incident_rate",
+                                    dropdown_state,
+                                ),
+                                id="treemap-chart",
                             ),
                             style={
                                 "gridColumn": "1/3",  # Spans columns 1 to 3
@@ -549,16 +477,10 @@ def update_tab_contents(
                         ),
                         # Third Graph: Spanning [2,0] to [2,1]
                         html.Div(
-                            dcc.Loading(
-                                children=[
-                                    dcc.Graph(
-                                        figure=create_stacked_bar_chart(
-                                            stacked_bar_chart, dropdown_state
-                                        ),
-                                        id="stacked-bar-chart",
-                                        style={"height": "100%", "width": "100%"},
-                                    )
-                                ]
+                            dcc.Graph(
+                                figure=stacked_bar_fig,
+                                id="stacked-bar-chart",
+                                style={"height": "100%", "width": "100%"},
                             ),
                             style={
                                 "gridColumn": "2",  # Spans columns 1 to 2
@@ -575,7 +497,49 @@ def update_tab_contents(
     return state_analysis_content, metric_analysis_content
 
 
+# The tab contents not in the cache are rendered by background jobs: while one runs,
+# its worker is free, and a newer change of the filters cancels the job of the one
+# before. The progress bar under the tabs replaces the contents being blocked while
+# they load
+@app.callback(
+    [Output("content", "children"), Output("content-metric-analysis", "children")],
+    [
+        Input("tabs", "value"),
+        Input("date-picker-range", "start_date"),
+        Input("date-picker-range", "end_date"),
+        Input("incident-filter-dropdown", "value"),
+        Input("kpi-select-dropdown", "value"),
+        Input("state-dropdown", "value"),
+    ],
+    background=True,
+    manager=JobManager(
+        launched=lambda inputs: prefetch_next_views(compute_tab_contents, inputs)
+    ),
+    running=[(Output("tab-progress", "style"), progress_shown, progress_hidden)],
+    progress=[Output("tab-progress", "value"), Output("tab-progress", "max")],
+    progress_default=[0, tab_steps],
+    interval=50,
+)
+@background_job
+def update_tab_contents(*inputs):
+    return compute_tab_contents(*inputs)
+
+
+# Cached tab contents are answered right away, without a job
+answer_cached(app, update_tab_contents, compute_tab_contents)
+
+
+# Precompute the tab contents of every state and KPI once the workers serve
+init_warmup(application, compute_tab_contents)
+
+
 if __name__ == "__main__":
-    application.run(
-        debug=True, host=os.environ.get("HOST", None), port=os.environ.get("PORT", None)
-    )
+    if os.environ.get("DEBUG"):
+        reset_metrics()
+        application.run(
+            debug=True,
+            host=os.environ.get("HOST", None),
+            port=os.environ.get("PORT", None),
+        )
+    else:
+        serve(application)
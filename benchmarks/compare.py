@@ -0,0 +1,45 @@
+import argparse
+import json
+import sys
+
+
+def compare(baseline, current, threshold, noise_ms):
+    # Benchmarks whose median got slower by more than the threshold
+    regressions = []
+    for scale, results in current["scales"].items():
+        previous = baseline["scales"].get(scale, {}).get("benchmarks", {})
+        for name, result in results["benchmarks"].items():
+            if name not in previous:
+                continue
+            before, after = previous[name]["p50_ms"], result["p50_ms"]
+            ratio = after / before if before else float("inf")
+            flag = ratio > threshold and after - before > noise_ms
+            print(
+                f"{scale:>5} {name:<70} {before:10.1f} {after:10.1f} {ratio:6.2f}"
+                + (" REGRESSION" if flag else "")
+            )
+            if flag:
+                regressions.append((scale, name))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the median latencies of two benchmark runs"
+    )
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument(
+        "--threshold", type=float, default=1.25, help="slowdown ratio that fails"
+    )
+    parser.add_argument(
+        "--noise-ms", type=float, default=1.0, help="slowdowns below this are ignored"
+    )
+    args = parser.parse_args()
+
+    with open(args.baseline) as baseline, open(args.current) as current:
+        regressions = compare(
+            json.load(baseline), json.load(current), args.threshold, args.noise_ms
+        )
+    print(f">>> {len(regressions)} regressions")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,378 @@
+import argparse
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# The app is imported in-process by load_app; results and metrics go to directories of
+# their own, so every run starts cold and never touches those of a running server
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="workplace-safety-load-"))
+os.environ.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="workplace-safety-load-"))
+
+# The server callbacks driven; the clientside ones cost no request
+callbacks = [
+    "update_tab_contents",
+    "update_dependent_charts",
+    "update_graphs_on_barchart_click",
+    "update_graphs_with_treemap_click",
+]
+
+# Seconds between the polls for the result of a background callback, as in the app
+poll_interval = 0.05
+
+# Stores of the metric analysis tab the linked chart callbacks read and write
+linked_stores = ["crossfilter-selection", "stacked-bar-traces"]
+
+# Name of the callback each virtual user thread is waiting for, to attribute cache lookups
+current = threading.local()
+cache_lookups = Counter()
+cache_lock = threading.Lock()
+
+
+def load_app():
+    import application
+
+    # Count the result lookups of the memoized callbacks and prepare_* functions
+    backend = application.cache.cache
+    get = backend.get
+
+    def counting_get(key):
+        value = get(key)
+        # FileSystemCache reads its entry count through get as well
+        if key != getattr(backend, "_fs_count_file", None):
+            with cache_lock:
+                # Lookups of the prefetcher are not waited for by any user
+                callback = getattr(current, "callback", "background")
+                cache_lookups[callback, value is not None] += 1
+        return value
+
+    backend.get = counting_get
+    return application
+
+
+def rss_mb():
+    # Resident memory now; the peak where /proc is not available
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def payload(dependency, values, changed):
+    # Body of the POST the browser sends for a callback, with the given property values
+    outputs = [
+        dict(zip(["id", "property"], output.rsplit(".", 1)))
+        for output in dependency["output"].strip(".").split("...")
+    ]
+    return {
+        "output": dependency["output"],
+        "outputs": outputs if len(outputs) > 1 else outputs[0],
+        "inputs": [
+            {**item, "value": values.get(f"{item['id']}.{item['property']}")}
+            for item in dependency["inputs"]
+        ],
+        "state": [
+            {**item, "value": values.get(f"{item['id']}.{item['property']}")}
+            for item in dependency["state"]
+        ],
+        "changedPropIds": [changed],
+    }
+
+
+class Choices:
+    # The values analysts pick from, taken from the loaded dataset
+    def __init__(self):
+        import src.data
+        from src.mappings import dropdown_options
+
+        self.min_date = pd.Timestamp(src.data.min_date)
+        self.max_date = pd.Timestamp(src.data.max_date)
+        self.incident_types = list(src.data.incident_types)
+        self.kpis = list(dropdown_options)
+        # States in proportion to their cases, as the larger ones get most attention
+        counts = src.data.data["state_code"].value_counts()
+        self.states = list(counts.index)
+        self.state_weights = (counts / counts.sum()).to_numpy()
+        self.outcomes = list(src.data.data["incident_outcome"].cat.categories)
+        self.occupations = list(
+            src.data.data[["soc_description_1", "soc_description_2"]]
+            .drop_duplicates()
+            .itertuples(index=False)
+        )
+
+    def filters(self, rng):
+        # The full range most of the time, otherwise a window of whole months, so that
+        # views repeat as often as they do for real users
+        start, end = self.min_date, self.max_date
+        if rng.random() < 0.5:
+            months = pd.date_range(self.min_date, self.max_date, freq="MS")
+            if len(months):
+                start = months[rng.integers(len(months))]
+                end = min(start + pd.DateOffset(months=int(rng.integers(1, 4))), end)
+        types = None
+        if rng.random() < 0.3:
+            types = [
+                str(value)
+                for value in rng.choice(self.incident_types, rng.integers(1, 3), False)
+            ]
+        return {
+            "date-picker-range.start_date": start.date().isoformat(),
+            "date-picker-range.end_date": end.date().isoformat(),
+            "incident-filter-dropdown.value": types,
+            "kpi-select-dropdown.value": self.kpis[rng.integers(len(self.kpis))],
+            "state-dropdown.value": str(rng.choice(self.states, p=self.state_weights)),
+        }
+
+    def zoom(self, rng):
+        start = rng.uniform(0, 20)
+        incident = rng.uniform(0, 20)
+        return {
+            "xaxis.range[0]": start,
+            "xaxis.range[1]": start + rng.uniform(1, 4),
+            "yaxis.range[0]": incident,
+            "yaxis.range[1]": incident + rng.uniform(1, 4),
+        }
+
+    def treemap_click(self, rng):
+        soc1, soc2 = self.occupations[rng.integers(len(self.occupations))]
+        if rng.random() < 0.5:
+            return {"points": [{"label": soc1, "parent": "US Market"}]}
+        return {"points": [{"label": soc2, "parent": soc1}]}
+
+
+def find_store(component, store):
+    # Data a store of the given id starts with in a rendered component tree
+    if isinstance(component, list):
+        found = (find_store(child, store) for child in component)
+        return next((data for data in found if data is not None), None)
+    if not isinstance(component, dict):
+        return None
+    props = component.get("props", {})
+    if props.get("id") == store:
+        return props.get("data")
+    return find_store(props.get("children"), store)
+
+
+def virtual_user(application, dependencies, choices, seed, think_time, stop, samples):
+    # A session of an analyst: pick filters, then drill into the metric analysis tab
+    # with zooms and clicks, pausing between interactions
+    rng = np.random.default_rng(seed)
+    client = application.application.test_client()
+
+    def request(callback, values, changed):
+        current.callback = callback
+        started = time.perf_counter()
+        body = payload(dependencies[callback], values, changed)
+        response = client.post("/_dash-update-component", json=body)
+        # A background callback answers with its job unless its result is cached, and
+        # the result of the job is polled for like the browser does
+        job = response.get_json(silent=True) or {}
+        while "cacheKey" in job or (job.get("multi") and "response" not in job):
+            if "cacheKey" in job:
+                query = f"cacheKey={job['cacheKey']}&job={job['job']}"
+            time.sleep(poll_interval)
+            response = client.post(f"/_dash-update-component?{query}", json=body)
+            job = response.get_json(silent=True) or {}
+        samples.append(
+            (
+                callback,
+                time.perf_counter() - started,
+                response.status_code < 300,
+                len(response.data),
+            )
+        )
+        # The stores of the linked charts are kept by the browser between clicks
+        if response.status_code == 200:
+            outputs = response.get_json()["response"]
+            for store in linked_stores:
+                if store in outputs:
+                    values[f"{store}.data"] = outputs[store]["data"]
+                elif "content-metric-analysis" in outputs:
+                    values[f"{store}.data"] = find_store(
+                        outputs["content-metric-analysis"]["children"], store
+                    )
+        if think_time:
+            time.sleep(rng.exponential(think_time))
+
+    while not stop.is_set():
+        values = choices.filters(rng)
+        values["tabs.value"] = (
+            "metric_analysis_tab" if rng.random() < 0.6 else "state_analysis_tab"
+        )
+        request("update_tab_contents", values, "tabs.value")
+        if values["tabs.value"] != "metric_analysis_tab":
+            continue
+
+        values["crossfilter-selection.data"] = {}
+        for _ in range(rng.integers(1, 4)):
+            if stop.is_set():
+                break
+            interaction = rng.integers(3)
+            if interaction == 0:
+                values["scatter-plot.relayoutData"] = choices.zoom(rng)
+                request("update_dependent_charts", values, "scatter-plot.relayoutData")
+            elif interaction == 1:
+                outcome = choices.outcomes[rng.integers(len(choices.outcomes))]
+                values["stacked-bar-chart.clickData"] = {"points": [{"y": outcome}]}
+                request(
+                    "update_graphs_on_barchart_click",
+                    values,
+                    "stacked-bar-chart.clickData",
+                )
+            else:
+                values["treemap-chart.clickData"] = choices.treemap_click(rng)
+                request(
+                    "update_graphs_with_treemap_click",
+                    values,
+                    "treemap-chart.clickData",
+                )
+
+
+def summarize(samples, lookups, users, elapsed, rss_start, rss_end):
+    report = {
+        "users": users,
+        "seconds": elapsed,
+        "requests": len(samples),
+        "errors": sum(not ok for _, _, ok, _ in samples),
+        "throughput_rps": len(samples) / elapsed,
+        "rss_start_mb": rss_start,
+        "rss_end_mb": rss_end,
+        "callbacks": {},
+    }
+    latencies, sizes = defaultdict(list), defaultdict(list)
+    for callback, latency, _, size in samples:
+        latencies[callback].append(latency * 1e3)
+        sizes[callback].append(size / 1024)
+    for callback in callbacks:
+        hits, misses = lookups[callback, True], lookups[callback, False]
+        timings = np.array(latencies[callback] or [np.nan])
+        report["callbacks"][callback] = {
+            "requests": len(latencies[callback]),
+            "p50_ms": np.percentile(timings, 50),
+            "p90_ms": np.percentile(timings, 90),
+            "p99_ms": np.percentile(timings, 99),
+            "max_ms": timings.max(),
+            "mean_response_kb": np.mean(sizes[callback] or [np.nan]),
+            "cache_hit_ratio": hits / (hits + misses) if hits + misses else None,
+        }
+    served = {key: count for key, count in lookups.items() if key[0] in callbacks}
+    hits = sum(count for (_, hit), count in served.items() if hit)
+    report["cache_hit_ratio"] = hits / sum(served.values()) if served else None
+    return report
+
+
+def run(users_levels, duration, think_time, seed):
+    application = load_app()
+    client = application.application.test_client()
+    # Outputs shared between callbacks are suffixed, so they are found by function name
+    names = {
+        output: getattr(entry.get("callback"), "__name__", None)
+        for output, entry in application.app.callback_map.items()
+    }
+    dependencies = {
+        names[dependency["output"]]: dependency
+        for dependency in client.get("/_dash-dependencies").get_json()
+        if names[dependency["output"]] in callbacks
+    }
+    choices = Choices()
+
+    # Each level runs on the cache the previous ones filled, like a server under growing load
+    reports = []
+    for users in users_levels:
+        samples = []
+        stop = threading.Event()
+        with cache_lock:
+            cache_lookups.clear()
+        rss_start = rss_mb()
+        threads = [
+            threading.Thread(
+                target=virtual_user,
+                args=(
+                    application,
+                    dependencies,
+                    choices,
+                    seed + user,
+                    think_time,
+                    stop,
+                    samples,
+                ),
+            )
+            for user in range(users)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        report = summarize(
+            samples,
+            Counter(cache_lookups),
+            users,
+            time.perf_counter() - started,
+            rss_start,
+            rss_mb(),
+        )
+        reports.append(report)
+
+        print(
+            f">>> {users} users: {report['requests']} requests, "
+            f"{report['throughput_rps']:.1f} req/s, {report['errors']} errors, "
+            f"cache hit ratio {report['cache_hit_ratio'] or 0:.2f}, "
+            f"RSS {rss_start:.0f} -> {report['rss_end_mb']:.0f} MB"
+        )
+        for callback, result in report["callbacks"].items():
+            print(
+                f"    {callback:<34} {result['requests']:6d} requests  "
+                f"p50 {result['p50_ms']:8.1f}  p90 {result['p90_ms']:8.1f}  "
+                f"p99 {result['p99_ms']:8.1f}  max {result['max_ms']:8.1f} ms  "
+                f"{result['mean_response_kb']:7.1f} KB"
+            )
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Drive the Dash callbacks of the app with concurrent virtual users"
+    )
+    parser.add_argument(
+        "--users",
+        type=int,
+        nargs="+",
+        default=[1, 4, 16],
+        help="concurrent users of each level, run one after the other",
+    )
+    parser.add_argument("--duration", type=float, default=60, help="seconds per level")
+    parser.add_argument(
+        "--think-time",
+        type=float,
+        default=1.0,
+        help="mean seconds a user waits between interactions",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file to write the report to")
+    args = parser.parse_args()
+
+    reports = run(args.users, args.duration, args.think_time, args.seed)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as file:
+            json.dump(
+                {
+                    "created": datetime.now().isoformat(timespec="seconds"),
+                    "think_time": args.think_time,
+                    "levels": reports,
+                },
+                file,
+                indent=2,
+            )
+        print(f">>> Wrote {args.output}")
@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from benchmarks.synthetic import write_dataset
+
+compute_functions = [
+    "compute_agg_incident_rate",
+    "compute_agg_fatality_rate",
+    "compute_agg_lost_workday_rate",
+    "compute_workforce_exposure",
+    "compute_agg_safety_score",
+]
+
+
+def default_rows():
+    # 1x is the size of the dataset the app serves, when it is available
+    path = os.environ.get("DATASET_PATH", "datasets/processed_data copy.parquet")
+    if os.path.exists(path):
+        return pq.ParquetFile(path).metadata.num_rows
+    return 100_000
+
+
+def filter_cases(data):
+    from src.filters import FilterSpec
+
+    start, end = data["date_of_incident"].min(), data["date_of_incident"].max()
+    dates = [start.isoformat(), end.isoformat()]
+    quarter = [start.isoformat(), (start + pd.Timedelta(days=90)).isoformat()]
+    return {
+        "all": FilterSpec.from_inputs(*dates),
+        "quarter": FilterSpec.from_inputs(*quarter),
+        "injuries": FilterSpec.from_inputs(*dates, ["Injury"]),
+        "quarter_illnesses": FilterSpec.from_inputs(
+            *quarter, ["Respiratory condition", "Skin disorder"]
+        ),
+        "outcome": FilterSpec.from_inputs(
+            *dates, incident_outcome="Days away from work (DAFW)"
+        ),
+        "time_box": FilterSpec.from_inputs(
+            *dates, time_started_work=(6.0, 9.0), time_of_incident=(8.0, 12.0)
+        ),
+    }
+
+
+def benchmarks():
+    # (name, function, case) for every function over the filter combinations; the
+    # prepare_* functions for the largest and the smallest state
+    import src.data
+
+    counts = src.data.data["state_code"].value_counts()
+    states = [counts.index[0], counts.index[-1]]
+    for case, spec in filter_cases(src.data.data).items():
+        yield f"filter_data[{case}]", lambda spec=spec: src.data.filter_data(spec)
+        df = src.data.filter_data(spec)
+        for name in compute_functions:
+            function = getattr(src.data, name)
+            yield f"{name}[{case}]", lambda function=function, df=df: function(df)
+        for kpi in ["incident_rate", "danger_score"]:
+            view = spec._replace(kpi=kpi)
+            yield (
+                f"prepare_state_data[{case},{kpi}]",
+                lambda view=view: src.data.prepare_state_data(view),
+            )
+        for state in states:
+            view = spec._replace(state=state, kpi="incident_rate")
+            for name in [
+                "prepare_radar_data",
+                "prepare_treemap_data",
+                "prepare_scatter_plot",
+                "prepare_stacked_bar_chart",
+            ]:
+                function = getattr(src.data, name)
+                yield (
+                    f"{name}[{case},{state}]",
+                    lambda function=function, view=view: function(view),
+                )
+
+
+def time_function(function, repeat, max_seconds):
+    # Filtered rows are cached between calls, so the caches are emptied before each one
+    import src.data
+
+    function()  # Warm up
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < repeat and (
+        len(timings) < 3 or time.perf_counter() - started < max_seconds
+    ):
+        src.data.clear_caches()
+        call_started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - call_started)
+
+    src.data.clear_caches()
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings = np.array(timings) * 1e3
+    return {
+        "runs": len(timings),
+        "mean_ms": timings.mean(),
+        "min_ms": timings.min(),
+        "p50_ms": np.percentile(timings, 50),
+        "p90_ms": np.percentile(timings, 90),
+        "p99_ms": np.percentile(timings, 99),
+        "max_ms": timings.max(),
+        "peak_alloc_mb": peak / 1024**2,
+    }
+
+
+def measure(output, repeat, max_seconds):
+    # Runs in a process of its own whose DATASET_PATH is the synthetic dataset
+    started = time.perf_counter()
+    import src.data
+
+    startup = time.perf_counter() - started
+    results = {}
+    for name, function in benchmarks():
+        results[name] = time_function(function, repeat, max_seconds)
+        print(f">>> {name}: p50 {results[name]['p50_ms']:.1f} ms")
+    with open(output, "w") as file:
+        json.dump(
+            {
+                "rows": len(src.data.data),
+                "startup_seconds": startup,
+                "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                / 1024,
+                "benchmarks": results,
+            },
+            file,
+        )
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(rows, scales, data_dir, output, repeat, max_seconds):
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.platform(),
+        "scales": {},
+    }
+    for scale in scales:
+        path = os.path.join(data_dir, f"synthetic-{rows * scale}.parquet")
+        if not os.path.exists(path):
+            print(f">>> Generating {rows * scale} rows to {path}")
+            write_dataset(rows * scale, path)
+
+        # Build the state from the parquet, never from a snapshot
+        env = dict(
+            os.environ,
+            DATASET_PATH=path,
+            SNAPSHOT_PATH=os.path.join(data_dir, "no-snapshot"),
+            METRICS_DIR=os.path.join(data_dir, "metrics"),
+        )
+        with tempfile.NamedTemporaryFile(suffix=".json") as result:
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.run", "--measure", result.name]
+                + ["--repeat", str(repeat), "--max-seconds", str(max_seconds)],
+                env=env,
+                check=True,
+            )
+            report["scales"][f"{scale}x"] = json.load(open(result.name))
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f">>> Wrote {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time the src.data functions on synthetic datasets"
+    )
+    parser.add_argument(
+        "--rows", type=int, default=None, help="rows at 1x, the served dataset's size"
+    )
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--data-dir", default=os.path.join("benchmarks", "data"))
+    parser.add_argument(
+        "--output",
+        default=os.path.join(
+            "benchmarks", "results", f"{datetime.now():%Y%m%d-%H%M%S}.json"
+        ),
+    )
+    parser.add_argument("--repeat", type=int, default=20, help="runs per benchmark")
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=10,
+        help="time per benchmark after which it stops repeating, with 3 runs at least",
+    )
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.repeat, args.max_seconds)
+    else:
+        run(
+            args.rows or default_rows(),
+            args.scales,
+            args.data_dir,
+            args.output,
+            args.repeat,
+            args.max_seconds,
+        )
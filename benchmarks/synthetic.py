@@ -0,0 +1,141 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.ingest import load_mapping
+from src.mappings import state_map
+from src.schema import dataset_schema
+
+incident_types = {
+    "Injury": 0.85,
+    "Skin disorder": 0.02,
+    "Respiratory condition": 0.06,
+    "Poisoning": 0.005,
+    "Hearing Loss": 0.015,
+    "All other illness": 0.05,
+}
+incident_outcomes = {
+    "Death": 0.003,
+    "Days away from work (DAFW)": 0.35,
+    "Job transfer or restriction": 0.2,
+    "Other recordable case": 0.447,
+}
+establishment_types = {
+    "Private industry": 0.9,
+    "Local government entity": 0.05,
+    "State government entity": 0.03,
+    "Not Stated": 0.015,
+    "Invalid Entry": 0.005,
+}
+
+
+def zipf_weights(size, rng, exponent=1.0):
+    # Skewed shares in random order, like cases per state, industry or occupation
+    weights = 1 / np.arange(1, size + 1) ** exponent
+    return rng.permutation(weights / weights.sum())
+
+
+def choose(rng, choices, size):
+    return rng.choice(list(choices), size, p=list(choices.values()))
+
+
+def generate(rows, seed=0):
+    # OSHA ITA case detail rows in the layout of the processed dataset: every state,
+    # about 4 cases per establishment, the real NAICS-5 and SOC descriptions and a
+    # year of incidents
+    rng = np.random.default_rng(seed)
+    states = np.array(list(state_map))
+    naics = np.array(
+        sorted(
+            {
+                description
+                for code, description in load_mapping("naics_data.pkl")["2022"].items()
+                if len(code) == 6
+            }
+        )
+    )
+    occupations = sorted(
+        {
+            tuple(groups[:2])
+            for groups in load_mapping("code_to_description.pkl").values()
+        }
+    )
+    occupations += [("Not assigned", "Not assigned")] * 3
+    occupations += [("Insufficient info", "Insufficient info")] * 3
+
+    # Establishments: their state, industry, size and hours worked
+    companies = max(rows // 4, 1)
+    company_state = rng.choice(
+        len(states), companies, p=zipf_weights(len(states), rng, 0.8)
+    )
+    company_naics = rng.choice(len(naics), companies, p=zipf_weights(len(naics), rng))
+    company_type = choose(rng, establishment_types, companies)
+    hours = np.clip(rng.lognormal(12, 1.5, companies), 2_000, 2e9).astype(np.int32)
+    employees = np.maximum(hours / rng.uniform(1_500, 2_200, companies), 1).astype(
+        np.int32
+    )
+    # A third of the establishments share the name of another one in their state, as
+    # those of a chain do, with hours and employees of their own
+    order = np.argsort(company_state, kind="stable")
+    ordered_state = company_state[order]
+    new_name = (rng.random(companies) >= 1 / 3) | np.r_[
+        True, ordered_state[1:] != ordered_state[:-1]
+    ]
+    name_id = np.empty(companies, dtype=np.int64)
+    name_id[order] = np.cumsum(new_name)
+    names = np.char.add("Company ", name_id.astype(str)).astype(object)
+
+    # Cases: larger establishments report more of them
+    company = rng.choice(companies, rows, p=hours / hours.sum())
+    occupation = rng.choice(
+        len(occupations), rows, p=zipf_weights(len(occupations), rng)
+    )
+    outcome = choose(rng, incident_outcomes, rows)
+    start_minute = (rng.normal(8 * 60, 150, rows) % 1440).astype(int)
+    incident_minute = (start_minute + rng.gamma(2, 120, rows)).astype(int) % 1440
+    day = pd.Timestamp("1900-01-01")
+
+    df = pd.DataFrame(
+        {
+            "case_number": np.arange(rows).astype(str).astype(object),
+            "company_name": names[company],
+            "state_code": pd.Categorical(states[company_state][company]),
+            "type_of_incident": pd.Categorical(choose(rng, incident_types, rows)),
+            "total_hours_worked": hours[company],
+            "annual_average_employees": employees[company],
+            "death": outcome == "Death",
+            "dafw_num_away": np.where(
+                outcome == "Days away from work (DAFW)", rng.geometric(0.05, rows), 0
+            ).astype(np.int16),
+            "djtr_num_tr": np.where(
+                outcome == "Job transfer or restriction", rng.geometric(0.05, rows), 0
+            ).astype(np.int16),
+            "date_of_incident": pd.Timestamp("2023-01-01")
+            + pd.to_timedelta(rng.integers(0, 365, rows), unit="D"),
+            "soc_description_1": pd.Categorical(
+                [occupations[i][0] for i in occupation]
+            ),
+            "soc_description_2": pd.Categorical(
+                [occupations[i][1] for i in occupation]
+            ),
+            "naics_description_5": pd.Categorical(naics[company_naics][company]),
+            "time_started_work": day + pd.to_timedelta(start_minute, unit="min"),
+            "time_of_incident": day + pd.to_timedelta(incident_minute, unit="min"),
+            "establishment_type": pd.Categorical(company_type[company]),
+            "incident_outcome": pd.Categorical(outcome),
+        }
+    )
+    return df
+
+
+def write_dataset(rows, path, seed=0):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    pq.write_table(
+        pa.Table.from_pandas(
+            generate(rows, seed), schema=dataset_schema, preserve_index=False
+        ),
+        path,
+    )
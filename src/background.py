@@ -0,0 +1,159 @@
+import itertools
+import os
+import tempfile
+import threading
+from functools import wraps
+
+import diskcache
+import flask
+import psutil
+from dash import DiskcacheManager
+from dash._utils import to_json
+
+from src.cache import cache, cache_key
+from src.metrics import job_in_flight
+from src.profiling import run_profiled, wants_profile
+
+# Results and progress of the background callbacks, shared by the workers on the host
+jobs_dir = os.environ.get(
+    "JOBS_DIR", os.path.join(tempfile.gettempdir(), "workplace-safety-jobs")
+)
+
+# Seconds the result of a job no browser fetched, e.g. of a closed tab, is kept
+job_expire = int(os.environ.get("JOB_EXPIRE", 600))
+
+# Numbers the jobs of this process; a job is named after its process and number
+job_numbers = itertools.count(1)
+
+# The job the current thread runs, if any, the function setting its progress and the
+# X-Profile header of the request that started it
+current_job = threading.local()
+
+
+class JobCancelled(BaseException):
+    # Ends a job its browser no longer waits for. Like the other cancellations of
+    # Python it is no Exception, so that Dash stores no error result for the job
+    pass
+
+
+class JobManager(DiskcacheManager):
+    # Runs each job of a background callback in a thread of the worker, which keeps the
+    # filter caches it fills for the requests to come. The browser may poll any worker
+    # for the result, so whether a job runs or was cancelled is kept in the diskcache
+    # next to its result. The browser sends the job it waits for along with a new
+    # request of the same callback; that job ends at its next progress report.
+    # launched is called with the inputs of every job started, and by answer_cached with
+    # those of every request answered from the cache
+    def __init__(self, launched=None):
+        super().__init__(diskcache.Cache(jobs_dir), expire=job_expire)
+        self.launched = launched
+
+    def call_job_fn(self, key, job_fn, args, context):
+        job = f"{os.getpid()}-{next(job_numbers)}"
+        self.handle.set(("running", job), True, expire=job_expire)
+        flask_app = flask.current_app._get_current_object()
+        header = flask.request.headers.get("X-Profile", "")
+        threading.Thread(
+            target=self.run_job,
+            args=(job, flask_app, header, key, job_fn, args, context),
+            daemon=True,
+            name=f"job-{job}",
+        ).start()
+        if self.launched:
+            self.launched(args)
+        return job
+
+    def run_job(self, job, flask_app, header, key, job_fn, args, context):
+        current_job.id = job
+        current_job.manager = self
+        current_job.header = header
+        try:
+            with flask_app.app_context(), job_in_flight():
+                job_fn(key, self._make_progress_key(key), args, context)
+        except JobCancelled:
+            pass
+        finally:
+            self.handle.delete(("running", job))
+            self.handle.delete(("cancelled", job))
+            current_job.__dict__.clear()
+
+    def job_running(self, job):
+        # A job of a worker that exited never finishes
+        if not job:
+            return False
+        pid = int(job.split("-")[0])
+        return psutil.pid_exists(pid) and self.handle.get(("running", job), False)
+
+    def terminate_job(self, job):
+        if self.job_running(job):
+            self.handle.set(("cancelled", job), True, expire=job_expire)
+
+    def cancelled(self, job):
+        return self.handle.get(("cancelled", job), False)
+
+
+def background_job(function):
+    # Runs the callback of a job, profiled like the requests of plain callbacks are;
+    # its progress is set through report_progress
+    @wraps(function)
+    def wrapper(set_progress, *args):
+        current_job.set_progress = set_progress
+        callback = function.__name__
+        profiled = wants_profile(callback, current_job.header)
+        return run_profiled(callback, list(args), profiled, function, *args)
+
+    return wrapper
+
+
+def report_progress(*progress):
+    # Sets the progress of the job the current thread runs, if any. A cancelled job
+    # ends here rather than rendering contents nobody will see
+    job = getattr(current_job, "id", None)
+    if job is None:
+        return
+    if current_job.manager.cancelled(job):
+        raise JobCancelled(job)
+    current_job.set_progress(list(progress))
+
+
+def answer_cached(dash_app, callback, render):
+    # Requests of the background callback whose outputs render has cached are answered
+    # at once, as a plain callback would be, instead of starting a job the browser then
+    # polls for; render takes the inputs of the callback and returns its outputs
+    server = dash_app.server
+    endpoint = f"{dash_app.config.routes_pathname_prefix}_dash-update-component"
+    view = server.view_functions[endpoint]
+
+    @wraps(view)
+    def cached_view(*args, **kwargs):
+        body = flask.request.get_json(silent=True) or {}
+        entry = dash_app.callback_map.get(body.get("output"), {})
+        name = getattr(entry.get("callback"), "__name__", None)
+        # Polls carry the key of their job's result
+        if name != callback.__name__ or "cacheKey" in flask.request.args:
+            return view(*args, **kwargs)
+        inputs = [item.get("value") for item in body.get("inputs", [])]
+        if not cache.cache.has(cache_key(render, *inputs)):
+            return view(*args, **kwargs)
+
+        manager = entry["manager"]
+        for job in flask.request.args.getlist("oldJob"):
+            manager.terminate_job(job)
+        # The next views are queued like those of a request that starts a job
+        if manager.launched:
+            manager.launched(inputs)
+        profiled = wants_profile(
+            callback.__name__, flask.request.headers.get("X-Profile", "")
+        )
+        values = run_profiled(callback.__name__, inputs, profiled, render, *inputs)
+        outputs = body["outputs"]
+        if isinstance(outputs, dict):  # A single output
+            outputs, values = [outputs], [values]
+        response = {}
+        for output, value in zip(outputs, values):
+            response.setdefault(output["id"], {})[output["property"]] = value
+        return flask.Response(
+            to_json({"multi": True, "response": response}), mimetype="application/json"
+        )
+
+    server.view_functions[endpoint] = cached_view
@@ -0,0 +1,129 @@
+import json
+import os
+import tempfile
+import threading
+from functools import wraps
+
+from dash._utils import to_json
+from flask_caching import Cache
+
+import src.data
+from src.data import (
+    prepare_radar_data,
+    prepare_scatter_plot,
+    prepare_stacked_bar_chart,
+    prepare_state_data,
+    prepare_treemap_data,
+)
+from src.metrics import annotate, count_event, timed
+
+# FileSystemCache is shared by every worker process on the host and replaces entries
+# atomically; set CACHE_TYPE=SimpleCache for a private in-process cache instead
+cache_config = {
+    "CACHE_TYPE": os.environ.get("CACHE_TYPE", "FileSystemCache"),
+    "CACHE_DIR": os.environ.get(
+        "CACHE_DIR", os.path.join(tempfile.gettempdir(), "workplace-safety-cache")
+    ),
+    "CACHE_DEFAULT_TIMEOUT": int(os.environ.get("CACHE_TIMEOUT", 600)),
+    "CACHE_THRESHOLD": int(os.environ.get("CACHE_THRESHOLD", 5000)),
+}
+cache = Cache(config=cache_config)
+
+
+# The dataset the latest cache key of each thread was made for
+keyed = threading.local()
+
+
+def versioned_name(fname):
+    # Keys carry the dataset version, so a data refresh never serves stale results
+    keyed.dataset = src.data.active
+    return f"{fname}@{keyed.dataset.version}"
+
+
+def unswapped(result):
+    # A result is only stored if no other dataset was swapped in since its key was
+    # made, so that a result is never stored under the version of another dataset
+    return keyed.dataset is src.data.active
+
+
+def cache_key(function, *args):
+    # Key of the result of a memoize()d function for these arguments
+    while not hasattr(function, "make_cache_key"):
+        function = function.__wrapped__
+    return function.make_cache_key(function.uncached, *args)
+
+
+def prefetch_marker(key):
+    # Set next to a result the prefetcher computed, until a request uses it
+    return f"prefetched:{key}"
+
+
+def memoize(prefetched=False):
+    # The span of a call is marked as a miss when the cached function actually runs.
+    # With prefetched, the first call served a result the prefetcher computed counts
+    # as a prefetch hit
+    def decorator(function):
+        @wraps(function)
+        def compute(*args, **kwargs):
+            annotate(cache="miss")
+            dataset = getattr(keyed, "dataset", None)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                keyed.dataset = dataset  # Nested calls made keys of their own
+
+        memoized = timed(cache="hit")(
+            cache.memoize(make_name=versioned_name, response_filter=unswapped)(compute)
+        )
+        if not prefetched:
+            return memoized
+
+        @wraps(memoized)
+        def counted(*args):
+            marker = prefetch_marker(cache_key(memoized, *args))
+            if cache.get(marker):
+                cache.delete(marker)
+                count_event("prefetch", "used")
+            return memoized(*args)
+
+        return counted
+
+    return decorator
+
+
+def as_json(function):
+    # Results kept as the plain JSON data Dash sends: unpickling components with plotly
+    # figures rebuilds and validates every figure, which is slower than rendering some
+    # of the views again
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        return json.loads(to_json(function(*args, **kwargs)))
+
+    return wrapper
+
+
+# The cached functions take a FilterSpec carrying only the fields they depend on,
+# so that its repr is a small, canonical cache key
+@memoize(prefetched=True)
+def prepare_scatter_plot_cached(spec):
+    return prepare_scatter_plot(spec)
+
+
+@memoize()
+def prepare_treemap_data_cached(spec):
+    return prepare_treemap_data(spec)
+
+
+@memoize(prefetched=True)
+def prepare_stacked_bar_chart_cached(spec):
+    return prepare_stacked_bar_chart(spec)
+
+
+@memoize()
+def prepare_radar_data_cached(spec):
+    return prepare_radar_data(spec)
+
+
+@memoize()
+def prepare_state_data_cached(spec):
+    return prepare_state_data(spec)
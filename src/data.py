@@ -1,150 +1,218 @@
+import hashlib
+import os
+import threading
+import time
 from datetime import datetime
+from functools import lru_cache
+from typing import NamedTuple
 
 import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 
-data = pd.read_parquet("datasets/processed_data copy.parquet")
+from src.filters import drilldown_fields
+from src.metrics import annotate, span, timed
+from src.schema import enforce_schema, time_minute_columns
+from src.snapshot import read_snapshot
 
+dataset_path = os.environ.get("DATASET_PATH", "datasets/processed_data copy.parquet")
 
-incident_types = sorted(data["type_of_incident"].unique())
-state_codes = sorted(data["state_code"].unique())
+# Releases added by `python -m src.ingest`, one parquet file each
+partitions_path = os.environ.get(
+    "PARTITIONS_PATH", os.path.splitext(dataset_path)[0] + ".partitions"
+)
 
+# Prepared in-memory state, written by `python -m src.snapshot`
+snapshot_path = os.environ.get(
+    "SNAPSHOT_PATH", os.path.splitext(dataset_path)[0] + ".snapshot"
+)
 
-def compute_agg_incident_rate(df, column=None):
-    # Deduplicate for company-level fields
-    deduplicated = df.drop_duplicates(subset=["state_code", "company_name"])
-    agg_cols = ["state_code", column] if column is not None else ["state_code"]
+# Seconds between checks of the running app for a newly ingested release
+refresh_interval = float(os.environ.get("REFRESH_INTERVAL", 30))
 
-    # Sum case numbers directly from injury-level data
-    injury_data = (
-        df.groupby(agg_cols, observed=False)
-        .agg(case_number=("case_number", "count"))
-        .reset_index()
-    )
 
-    # Aggregate deduplicated company-level data
-    company_data = (
-        deduplicated.groupby(agg_cols, observed=False)
-        .agg(total_hours_worked=("total_hours_worked", "sum"))
-        .reset_index()
-    )
+def dataset_files():
+    # The base dataset followed by the ingested releases, in the order they were added
+    if not os.path.isdir(partitions_path):
+        return [dataset_path]
+    return [dataset_path] + [
+        os.path.join(partitions_path, name)
+        for name in sorted(os.listdir(partitions_path))
+        if name.endswith(".parquet")
+    ]
 
-    # Merge and calculate incident rate
-    temp = injury_data.merge(company_data, on=agg_cols, how="left")
-    temp["incident_rate"] = np.where(
-        temp["total_hours_worked"] > 0,
-        temp["case_number"] / temp["total_hours_worked"] * 1e5,
-        0,
-    )
-    return temp[agg_cols + ["incident_rate"]]
 
+def dataset_fingerprint(paths):
+    stats = [(os.path.abspath(path), os.stat(path)) for path in paths]
+    key = ";".join(f"{path}:{stat.st_size}:{stat.st_mtime_ns}" for path, stat in stats)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+def unify_categories(frames):
+    # Give the categorical columns the frames share the sorted union of their
+    # categories, so that they concatenate without falling back to object columns
+    dtypes = {}
+    for column, dtype in frames[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype) and all(
+            column in frame for frame in frames
+        ):
+            categories = union_categoricals(
+                [frame[column] for frame in frames], sort_categories=True
+            ).categories
+            dtypes[column] = pd.CategoricalDtype(categories)
+    return [
+        frame.astype({column: dtypes[column] for column in frame if column in dtypes})
+        for frame in frames
+    ]
 
-def compute_agg_fatality_rate(df, column=None):
-    # Deduplicate for company-level fields
-    # deduplicated = df.drop_duplicates(subset=["state_code", "company_name"])
-    agg_cols = ["state_code", column] if column is not None else ["state_code"]
 
-    # Sum fatalities directly from injury-level data
-    temp = (
-        df.groupby(agg_cols, observed=False)
-        .agg(death=("death", "sum"), case_number=("case_number", "count"))
-        .reset_index()
-    )
+def read_dataset(paths):
+    if len(paths) == 1:
+        return enforce_schema(pd.read_parquet(paths[0]))
+    frames = unify_categories([enforce_schema(pd.read_parquet(path)) for path in paths])
+    return pd.concat(frames, ignore_index=True)
 
-    # Merge and calculate fatality rate
-    # temp = injury_data.merge(company_data, on=agg_cols, how="left")
-    temp["fatality_rate"] = np.where(
-        temp["case_number"] > 0,
-        temp["death"] / temp["case_number"] * 1e4,
-        0,
+
+def build_company_dimension(df):
+    # Number (state, company name) pairs in order of appearance. Establishments of a
+    # chain share a name but not their hours and employees, so those stay on the rows
+    company_id = (
+        df.groupby(
+            ["state_code", "company_name"], observed=True, sort=False, dropna=False
+        )
+        .ngroup()
+        .astype(np.int32)
+    )
+    companies = df.loc[
+        ~company_id.duplicated(),
+        ["state_code", "company_name"],
+    ].reset_index(drop=True)
+    return company_id, companies
+
+
+kpi_columns = [
+    "incident_rate",
+    "fatality_rate",
+    "lost_workday_rate",
+    "workforce_exposure",
+    "danger_score",
+]
+
+# Dimensions the dashboard slices by; the KPI cube holds one row per observed combination
+cube_dimensions = [
+    "state_code",
+    "type_of_incident",
+    "incident_outcome",
+    "establishment_type",
+    "soc_description_1",
+    "soc_description_2",
+]
+soc_levels = ["soc_description_1", "soc_description_2"]
+company_measures = ["companies", "total_hours_worked", "annual_average_employees"]
+
+# Company-level fields are counted once per company at each of these levels
+company_levels = {"": [], "soc_": soc_levels}
+
+# Fractional hour of every minute of the day, the values on the scatter plot axes
+minute_hours = np.arange(24 * 60) // 60 + np.arange(24 * 60) % 60 / 60
+
+
+def minute_bounds(time_range):
+    # Minutes of the day [first, last) whose fractional hour is within the range
+    low, high = time_range
+    return (
+        np.searchsorted(minute_hours, low, side="left"),
+        np.searchsorted(minute_hours, high, side="right"),
     )
-    return temp[agg_cols + ["fatality_rate"]]
 
 
-def compute_agg_lost_workday_rate(df, column=None):
-    agg_cols = ["state_code", column] if column is not None else ["state_code"]
+def aggregate_measures(df, by, levels=("",), observed=False):
+    # Company-level fields only count on the first row of each company in the grouped
+    # rows, in the order of the dataset files, and that row supplies its own figures;
+    # every additive measure can then be summed in a single grouped pass
+    measures = pd.DataFrame(
+        {
+            "case_number": df["case_number"].notna(),
+            "death": df["death"],
+            "dafw_num_away": df["dafw_num_away"],
+            "djtr_num_tr": df["djtr_num_tr"],
+        }
+    )
+    source_row = df["source_row"]
+    for prefix in levels:
+        keys = [df["company_id"]] + [df[level] for level in company_levels[prefix]]
+        first_row = source_row == source_row.groupby(
+            keys, observed=True, sort=False
+        ).transform("min")
+        measures[f"{prefix}companies"] = first_row
+        for column in company_measures[1:]:
+            measures[f"{prefix}{column}"] = np.where(first_row, df[column], 0)
 
-    # Sum injury-level data
-    injury_data = (
-        df.groupby(agg_cols, observed=False)
-        .agg(
-            dafw_num_away=("dafw_num_away", "sum"),
-            djtr_num_tr=("djtr_num_tr", "sum"),
-            case_number=("case_number", "count"),
-        )
+    return (
+        measures.groupby([df[column] for column in by], observed=observed)
+        .sum()
         .reset_index()
     )
 
-    # Calculate lost workdays and rate
-    injury_data["total_lost_days"] = (
-        injury_data["dafw_num_away"] + injury_data["djtr_num_tr"]
+
+def compute_kpis(totals):
+    totals["incident_rate"] = np.where(
+        totals["total_hours_worked"] > 0,
+        totals["case_number"] / totals["total_hours_worked"] * 1e5,
+        0,
+    )
+    totals["fatality_rate"] = np.where(
+        totals["case_number"] > 0,
+        totals["death"] / totals["case_number"] * 1e4,
+        0,
+    )
+    totals["lost_workday_rate"] = np.where(
+        totals["case_number"] > 0,
+        (totals["dafw_num_away"] + totals["djtr_num_tr"]) / totals["case_number"],
+        0,
     )
-    injury_data["lost_workday_rate"] = np.where(
-        injury_data["case_number"] > 0,
-        injury_data["total_lost_days"] / injury_data["case_number"],
+    totals["workforce_exposure"] = np.where(
+        totals["case_number"] > 0,
+        totals["case_number"] / totals["annual_average_employees"] * 1e2,
         0,
     )
-    return injury_data[agg_cols + ["lost_workday_rate"]]
+    totals["danger_score"] = (
+        2.38 * totals["incident_rate"]
+        + 3.33 * totals["fatality_rate"]
+        + 0.37 * totals["lost_workday_rate"]
+        + 1.4 * totals["workforce_exposure"]
+    )
+    return totals
 
 
-def compute_workforce_exposure(df, column=None):
-    # Deduplicate for company-level fields
-    deduplicated = df.drop_duplicates(subset=["state_code", "company_name"])
+def compute_kpi_table(df, column=None):
     agg_cols = ["state_code", column] if column is not None else ["state_code"]
+    return compute_kpis(aggregate_measures(df, agg_cols))
 
-    # Sum injury-level data
-    injury_data = (
-        df.groupby(agg_cols, observed=False)
-        .agg(case_number=("case_number", "count"))
-        .reset_index()
-    )
 
-    # Aggregate deduplicated company-level data
-    company_data = (
-        deduplicated.groupby(agg_cols, observed=False)
-        .agg(annual_average_employees=("annual_average_employees", "sum"))
-        .reset_index()
-    )
+def compute_agg_incident_rate(df, column=None):
+    agg_cols = ["state_code", column] if column is not None else ["state_code"]
+    return compute_kpi_table(df, column)[agg_cols + ["incident_rate"]]
 
-    # Merge and calculate workforce exposure
-    temp = injury_data.merge(company_data, on=agg_cols, how="left")
-    temp["workforce_exposure"] = np.where(
-        temp["case_number"] > 0,
-        temp["case_number"] / temp["annual_average_employees"] * 1e2,
-        0,
-    )
-    return temp[agg_cols + ["workforce_exposure"]]
+
+def compute_agg_fatality_rate(df, column=None):
+    agg_cols = ["state_code", column] if column is not None else ["state_code"]
+    return compute_kpi_table(df, column)[agg_cols + ["fatality_rate"]]
+
+
+def compute_agg_lost_workday_rate(df, column=None):
+    agg_cols = ["state_code", column] if column is not None else ["state_code"]
+    return compute_kpi_table(df, column)[agg_cols + ["lost_workday_rate"]]
+
+
+def compute_workforce_exposure(df, column=None):
+    agg_cols = ["state_code", column] if column is not None else ["state_code"]
+    return compute_kpi_table(df, column)[agg_cols + ["workforce_exposure"]]
 
 
 def compute_agg_safety_score(df, column=None):
-    stats = compute_agg_incident_rate(df, column)
-    stats = stats.merge(
-        compute_agg_fatality_rate(df, column),
-        on=["state_code"] + ([column] if column else []),
-        how="left",
-    )
-    stats = stats.merge(
-        compute_agg_lost_workday_rate(df, column),
-        on=["state_code"] + ([column] if column else []),
-        how="left",
-    )
-    stats = stats.merge(
-        compute_workforce_exposure(df, column),
-        on=["state_code"] + ([column] if column else []),
-        how="left",
-    )
-    # stats = stats.merge(
-    #     compute_death_to_incident_ratio(df, column),
-    #     on=["state_code"] + ([column] if column else []),
-    #     how="left",
-    # )
-    stats["danger_score"] = (
-        2.38 * stats["incident_rate"]
-        + 3.33 * stats["fatality_rate"]
-        + 0.37 * stats["lost_workday_rate"]
-        + 1.4 * stats["workforce_exposure"]
-    )
-    return stats
+    agg_cols = ["state_code", column] if column is not None else ["state_code"]
+    return compute_kpi_table(df, column)[agg_cols + kpi_columns]
 
 
 kpi_name_function_mapping = {
@@ -156,147 +224,439 @@ kpi_name_function_mapping = {
     "danger_score": compute_agg_safety_score,
 }
 
-region_safety_score = compute_agg_safety_score(data)
 
-# Initialize dictionaries to store min, max, and mean
-min_metric_values = {}
-max_metric_values = {}
-mean_metric_values = {}
+def kpi_output_columns(kpi):
+    # The safety score carries its components along, the other KPIs only themselves
+    return kpi_columns if kpi == "danger_score" else [kpi]
 
-# Single loop to calculate all statistics
-for metric in kpi_name_function_mapping:
-    column_data = region_safety_score[metric]
-    min_metric_values[metric] = column_data.min()
-    max_metric_values[metric] = column_data.max()
-    mean_metric_values[metric] = column_data.mean()
 
+def build_kpi_cube(df):
+    return aggregate_measures(
+        df, cube_dimensions, levels=tuple(company_levels), observed=True
+    )
 
-def filter_data(df, start_date, end_date, filter_incident_types):
-    start_date = datetime.fromisoformat(start_date)
-    end_date = datetime.fromisoformat(end_date)
 
-    # Determine if filtering is necessary
-    use_precomputed = (
-        start_date == df["date_of_incident"].min()
-        and end_date == df["date_of_incident"].max()
+def rollup_cube(cube, by, observed=False, prefix=""):
+    # Sum the cube cells up to the `by` level, picking the company measures counted at that level
+    columns = {
+        f"{prefix}{name}" if name in company_measures else name: name
+        for name in ["case_number", "death", "dafw_num_away", "djtr_num_tr"]
+        + company_measures
+    }
+    return (
+        cube.groupby(by, observed=observed)[list(columns)]
+        .sum()
+        .rename(columns=columns)
+        .reset_index()
     )
 
-    if use_precomputed and not filter_incident_types:
-        return df  # Return unfiltered dataset if precomputed can be used
 
-    # Apply filtering
-    filtered_data = df[
-        (df["date_of_incident"] >= start_date) & (df["date_of_incident"] <= end_date)
-    ]
-    if filter_incident_types:
-        filtered_data = filtered_data[
-            filtered_data["type_of_incident"].isin(filter_incident_types)
-        ]
+def build_indexes(df):
+    # Row indexes of the date-sorted dataset used by base_rows
+    return {
+        # Sorted row ids of every incident type
+        "incident_type_rows": df.groupby("type_of_incident", observed=True).indices,
+    }
 
-    return filtered_data
 
+def summarize_regions(region_safety_score):
+    return {
+        "region_safety_score": region_safety_score,
+        "min_metric_values": region_safety_score[kpi_columns].min().to_dict(),
+        "max_metric_values": region_safety_score[kpi_columns].max().to_dict(),
+        "mean_metric_values": region_safety_score[kpi_columns].mean().to_dict(),
+    }
 
-def prepare_mean_radar_data(radar_region_safety_score):
-    mean_values = radar_region_safety_score.iloc[:, 1:].mean()
 
-    # Add the mean values as new columns to the dataframe
-    for col in mean_values.index:
-        radar_region_safety_score[f"mean_{col}"] = mean_values[col]
+def build_state(df):
+    # Everything derived from the dataset at startup; a snapshot stores exactly this
+    # Keep rows in date order so that a date range is a contiguous block of rows, and
+    # their position in the dataset files, which decides the first row of a company
+    df["source_row"] = np.arange(len(df), dtype=np.int32)
+    if not df["date_of_incident"].is_monotonic_increasing:
+        df = df.sort_values("date_of_incident", kind="stable", ignore_index=True)
+    df["company_id"], company_table = build_company_dimension(df)
 
-    return radar_region_safety_score
+    kpi_cube = build_kpi_cube(df)
+    region_safety_score = compute_kpis(rollup_cube(kpi_cube, "state_code"))[
+        ["state_code"] + kpi_columns
+    ]
 
+    return {
+        "data": df,
+        "companies": company_table,
+        "kpi_cube": kpi_cube,
+        **summarize_regions(region_safety_score),
+        "incident_types": sorted(df["type_of_incident"].unique()),
+        "state_codes": sorted(df["state_code"].unique()),
+        "min_date": df["date_of_incident"].min(),
+        "max_date": df["date_of_incident"].max(),
+        **build_indexes(df),
+    }
 
-def calculate_mean_values(min_metric_values, max_metric_values, metrics, mean_values):
-    return [
-        (
-            (mean_value - min_metric_values[metric])
-            / (max_metric_values[metric] - min_metric_values[metric])
-            if max_metric_values[metric] > min_metric_values[metric]
-            else 0
-        )
-        for metric, mean_value in zip(metrics, mean_values)
-    ]
 
+def append_state(state, rows):
+    # The state with a new release appended. Company-level fields count once per
+    # company, so only the KPI cube cells of the companies in the release and the
+    # regions they belong to change
+    rows = enforce_schema(rows)
+    rows["source_row"] = np.arange(len(rows), dtype=np.int32) + len(state["data"])
+    rows = rows.sort_values("date_of_incident", kind="stable", ignore_index=True)
+    data, rows = unify_categories([state["data"], rows])
+    rows = rows.astype(data.dtypes[rows.columns])
+
+    # Companies already loaded keep their ids, new ones are numbered after them
+    company_id, release_companies = build_company_dimension(rows)
+    previous_companies, release_companies = unify_categories(
+        [state["companies"], release_companies]
+    )
+    keys = ["state_code", "company_name"]
+    ids = pd.MultiIndex.from_frame(previous_companies[keys]).get_indexer(
+        pd.MultiIndex.from_frame(release_companies[keys])
+    )
+    added = ids < 0
+    ids[added] = len(previous_companies) + np.arange(added.sum())
+    rows["company_id"] = ids.astype(np.int32)[company_id]
 
-def prepare_radar_data(df, state_code):
-    # Compute radar region safety score
-    if df is data:  # No filtering applied, use precomputed values
-        radar_region_safety_score = region_safety_score
-    else:
-        radar_region_safety_score = compute_agg_safety_score(df)
+    merged = pd.concat([data, rows], ignore_index=True).sort_values(
+        "date_of_incident", kind="stable", ignore_index=True
+    )
+    before = data[data["company_id"].isin(ids)]
+    after = merged[merged["company_id"].isin(ids)]
 
-    radar_region_safety_score = prepare_mean_radar_data(radar_region_safety_score)
+    companies = pd.concat(
+        [previous_companies, release_companies[added]], ignore_index=True
+    )
 
-    # Extract metrics
-    metrics = [
-        "incident_rate",
-        "fatality_rate",
-        "lost_workday_rate",
-        "workforce_exposure",
-        "danger_score",
-    ]
-    metric_values = radar_region_safety_score.loc[
-        radar_region_safety_score["state_code"] == state_code, metrics
-    ].squeeze()
-
-    # Scale metrics
-    scaled_values = [
-        (
-            (metric_values[metric] - min_metric_values[metric])
-            / (max_metric_values[metric] - min_metric_values[metric])
-            if max_metric_values[metric] > min_metric_values[metric]
-            else 0
+    # Company-level fields are attributed per company, so the cube changes by the
+    # cube of these companies' rows with the release minus the one without it
+    without_release = build_kpi_cube(before)
+    measures = without_release.columns.difference(cube_dimensions)
+    without_release[measures] = -without_release[measures]
+    kpi_cube = (
+        pd.concat(
+            unify_categories([state["kpi_cube"], rows])[:1]
+            + [build_kpi_cube(after), without_release]
         )
-        for metric in metrics
-    ]
-    mean_values = [
-        radar_region_safety_score[f"mean_{metric}"].iloc[0] for metric in metrics
-    ]
+        .groupby(cube_dimensions, observed=True)
+        .sum()
+        .reset_index()
+    )
 
-    scaled_mean_values = calculate_mean_values(
-        min_metric_values, max_metric_values, metrics, mean_values
+    regions = rows["state_code"].unique()
+    region_safety_score = unify_categories([state["region_safety_score"], rows])[0]
+    region_safety_score = (
+        pd.concat(
+            [
+                region_safety_score[~region_safety_score["state_code"].isin(regions)],
+                compute_kpis(
+                    rollup_cube(
+                        kpi_cube[kpi_cube["state_code"].isin(regions)],
+                        "state_code",
+                        observed=True,
+                    )
+                )[["state_code"] + kpi_columns],
+            ]
+        )
+        .sort_values("state_code")
+        .reset_index(drop=True)
     )
 
-    # Construct radar data
-    radar_data = {
-        "kpi": metrics,
-        "value": metric_values.tolist(),
-        "scaled_value": scaled_values,
-        "mean_value": mean_values,
-        "scaled_mean_value": scaled_mean_values,
+    return {
+        "data": merged,
+        "companies": companies,
+        "kpi_cube": kpi_cube,
+        **summarize_regions(region_safety_score),
+        "incident_types": sorted(
+            set(state["incident_types"]) | set(rows["type_of_incident"].unique())
+        ),
+        "state_codes": sorted(
+            set(state["state_codes"]) | set(rows["state_code"].unique())
+        ),
+        "min_date": min(state["min_date"], rows["date_of_incident"].min()),
+        "max_date": max(state["max_date"], rows["date_of_incident"].max()),
+        **build_indexes(merged),
     }
-    return pd.DataFrame(radar_data)
 
 
-def prepare_state_data(df, kpi="incident_rate"):
-    # Deduplicate company-level fields
-    deduplicated = df.drop_duplicates(subset=["state_code", "company_name"])
+class Dataset:
+    # A prepared state and the arrays derived from it, never modified once built. A
+    # swap publishes a new one with a single assignment to `active`; every function
+    # takes the active dataset once and works from it, so that a render running during
+    # a swap never mixes the rows of one release with the aggregates of another
+    __slots__ = (
+        "state",
+        "version",
+        "data",
+        "companies",
+        "kpi_cube",
+        "region_safety_score",
+        "incident_types",
+        "state_codes",
+        "min_date",
+        "max_date",
+        "incident_dates",
+        "incident_type_rows",
+        "min_metric_values",
+        "max_metric_values",
+        "mean_metric_values",
+        "metric_minimums",
+        "metric_spans",
+    )
 
-    # Aggregate deduplicated company-level data
-    company_data = (
-        deduplicated.groupby("state_code", observed=False)
-        .agg(
-            annual_average_employees_median=("annual_average_employees", "mean"),
-            annual_average_employees_sum=("annual_average_employees", "sum"),
-            total_hours_worked=("total_hours_worked", "mean"),
+    def __init__(self, state, version):
+        self.state = state
+        self.version = version
+        self.data = state["data"]
+        self.companies = state["companies"]
+        self.kpi_cube = state["kpi_cube"]
+        self.region_safety_score = state["region_safety_score"]
+        self.incident_types = state["incident_types"]
+        self.state_codes = state["state_codes"]
+        self.min_date = state["min_date"]
+        self.max_date = state["max_date"]
+        self.incident_dates = self.data["date_of_incident"].to_numpy()
+        self.incident_type_rows = state["incident_type_rows"]
+        self.min_metric_values = state["min_metric_values"]
+        self.max_metric_values = state["max_metric_values"]
+        self.mean_metric_values = state["mean_metric_values"]
+        self.metric_minimums = np.array(
+            [self.min_metric_values[kpi] for kpi in kpi_columns]
         )
-        .reset_index()
+        self.metric_spans = (
+            np.array([self.max_metric_values[kpi] for kpi in kpi_columns])
+            - self.metric_minimums
+        )
+        self.metric_minimums.flags.writeable = False
+        self.metric_spans.flags.writeable = False
+
+
+def __getattr__(name):
+    # The fields of the active dataset read as module attributes, e.g. src.data.min_date
+    if name in Dataset.__slots__:
+        return getattr(active, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def load_state():
+    # The state of the dataset files as they are now, and their version
+    version = dataset_fingerprint(dataset_files())
+    started = time.perf_counter()
+    state = read_snapshot(snapshot_path, version)
+    source = snapshot_path
+    if state is None:  # Missing or built from another version of the dataset
+        state = build_state(read_dataset(dataset_files()))
+        source = dataset_path
+    print(
+        f">>> Loaded dataset {version} from {source} "
+        f"in {time.perf_counter() - started:.2f}s"
     )
-
-    # Aggregate injury-level data
-    injury_data = (
-        df.groupby("state_code", observed=False)
-        .agg(
-            dafw_num_away=("dafw_num_away", "mean"),
-            djtr_num_tr=("djtr_num_tr", "mean"),
-            death=("death", "mean"),
-            case_number=("case_number", "count"),
+    return state, version
+
+
+def activate_state(new_state, version):
+    # Publish a prepared state; the version changes whenever the parquet is regenerated
+    # or a release is added, and cached results are keyed by it
+    global active
+    active = Dataset(new_state, version)
+
+
+activate_state(*load_state())
+last_refresh = time.monotonic()
+refresh_lock = threading.Lock()
+
+
+def refresh_state():
+    # Swap in a newly ingested release once its snapshot is ready; until then, and
+    # between checks, the current release keeps being served. One thread checks at a
+    # time while the others go on serving
+    global last_refresh
+    if time.monotonic() - last_refresh < refresh_interval:
+        return
+    if not refresh_lock.acquire(blocking=False):
+        return
+    try:
+        last_refresh = time.monotonic()
+        version = dataset_fingerprint(dataset_files())
+        if version == active.version:
+            return
+        new_state = read_snapshot(snapshot_path, version)
+        if new_state is None:
+            return
+        activate_state(new_state, version)
+    finally:
+        refresh_lock.release()
+    # The filter caches are keyed by the dataset, so a render still working from the
+    # previous one never fills them for the new one; clearing them frees its rows
+    clear_caches()
+    print(f">>> Swapped in dataset {version}")
+
+
+def clear_caches():
+    # Results derived from the filtered rows of the active state
+    for cached in [filter_rows, dimension_mask, base_rows, radar_matrix]:
+        cached.cache_clear()
+
+
+def filter_data(spec, dataset=None):
+    if dataset is None:
+        dataset = active
+    with span("filter_data", cache="none") as record:
+        hits = filter_rows.cache_info().hits
+        df = filter_rows(dataset, spec.row_filters)
+        record.update(
+            cache="hit" if filter_rows.cache_info().hits > hits else "miss",
+            rows_returned=len(df),
         )
-        .reset_index()
+    # The filtered rows are what the calling stage goes on to scan
+    annotate(rows_scanned=len(df))
+    return df
+
+
+@lru_cache(maxsize=16)
+def filter_rows(dataset, spec):
+    # Rows of the date range and incident types, narrowed by the drill-down selections;
+    # each selection is a cached mask, so changing one only computes its own
+    base = spec.base_filters
+    masks = [
+        dimension_mask(dataset, base, field, getattr(spec, field))
+        for field in drilldown_fields
+        if getattr(spec, field) is not None
+    ]
+    if not masks:
+        return base_rows(dataset, base)
+    return base_rows(dataset, base)[np.logical_and.reduce(masks)]
+
+
+@lru_cache(maxsize=32)
+def dimension_mask(dataset, spec, field, value):
+    # Rows of base_rows(dataset, spec) within the selection of a single drill-down field
+    rows = base_rows(dataset, spec)
+    if field in time_minute_columns:
+        first, last = minute_bounds(value)
+        minutes = rows[time_minute_columns[field]].to_numpy()
+        mask = (minutes >= first) & (minutes < last)
+    else:
+        mask = (rows[field] == value).to_numpy()
+    mask.flags.writeable = False
+    return mask
+
+
+@lru_cache(maxsize=16)
+def base_rows(dataset, spec):
+    start_date = datetime.fromisoformat(spec.start_date)
+    end_date = datetime.fromisoformat(spec.end_date)
+    data = dataset.data
+
+    # Selecting every incident type is the same as selecting none
+    filter_incident_types = spec.incident_types
+    if set(filter_incident_types) >= set(dataset.incident_types):
+        filter_incident_types = ()
+
+    # Determine if filtering is necessary
+    use_precomputed = start_date == dataset.min_date and end_date == dataset.max_date
+
+    # The date range is a slice of the date-sorted rows
+    dates = dataset.incident_dates
+    start = np.searchsorted(dates, np.datetime64(start_date), side="left")
+    stop = np.searchsorted(dates, np.datetime64(end_date), side="right")
+
+    if use_precomputed and not filter_incident_types:
+        return data  # Keep the unfiltered dataset so precomputed values apply
+    if filter_incident_types:
+        # Row ids of each type are sorted too, so the slice is a run of each list
+        rows = [
+            type_rows[
+                np.searchsorted(type_rows, start) : np.searchsorted(type_rows, stop)
+            ]
+            for type_rows in (
+                dataset.incident_type_rows.get(
+                    incident_type, np.empty(0, dtype=np.intp)
+                )
+                for incident_type in filter_incident_types
+            )
+        ]
+        return data.take(np.sort(np.concatenate(rows)))
+    return data.iloc[start:stop]
+
+
+class RadarMatrix(NamedTuple):
+    # KPIs of every state for a set of row filters, as read-only arrays
+    rows: dict  # State code to row of `values`
+    values: np.ndarray  # States x KPIs
+    mean: np.ndarray  # Mean of every KPI over the states
+
+
+@lru_cache(maxsize=16)
+def radar_matrix(dataset, spec):
+    df = filter_rows(dataset, spec)
+    if df is dataset.data:  # No filtering applied, use precomputed values
+        scores = dataset.region_safety_score
+    else:
+        scores = compute_agg_safety_score(df)
+    values = scores[kpi_columns].to_numpy(dtype=np.float64, copy=True)
+    mean = scores[kpi_columns].mean().to_numpy()
+    values.flags.writeable = mean.flags.writeable = False
+    rows = {state_code: row for row, state_code in enumerate(scores["state_code"])}
+    return RadarMatrix(rows, values, mean)
+
+
+def scale_metrics(dataset, values):
+    # Scale KPIs to [0, 1] by the range of the state KPIs over the full dataset
+    spans = dataset.metric_spans
+    return np.where(
+        spans > 0, (values - dataset.metric_minimums) / np.where(spans > 0, spans, 1), 0
     )
 
-    # Merge company-level and injury-level data
-    aggregated_data = pd.merge(company_data, injury_data, on="state_code", how="inner")
+
+@timed()
+def prepare_radar_data(spec):
+    # A row of the filters' radar matrix; nothing is recomputed when only the state
+    # changes, and nothing shared is modified
+    dataset = active
+    matrix = radar_matrix(dataset, spec.row_filters)
+    annotate(rows_scanned=len(matrix.values))
+    row = matrix.rows.get(spec.state)
+    values = (
+        matrix.values[row] if row is not None else np.full(len(kpi_columns), np.nan)
+    )
+    return pd.DataFrame(
+        {
+            "kpi": kpi_columns,
+            "value": values,
+            "scaled_value": scale_metrics(dataset, values),
+            "mean_value": matrix.mean,
+            "scaled_mean_value": scale_metrics(dataset, matrix.mean),
+        }
+    )
+
+
+@timed()
+def prepare_state_data(spec):
+    dataset = active
+    df = filter_data(spec, dataset)
+    kpi = spec.kpi or "incident_rate"
+
+    if df is dataset.data:  # No filtering applied, answer from the KPI cube
+        totals = compute_kpis(rollup_cube(dataset.kpi_cube, "state_code"))
+        annotate(rows_scanned=len(dataset.kpi_cube))
+    else:
+        totals = compute_kpi_table(df)
+
+    # Company-level averages are taken over companies, injury-level ones over cases
+    aggregated_data = pd.DataFrame(
+        {
+            "state_code": totals["state_code"],
+            "annual_average_employees_median": totals["annual_average_employees"]
+            / totals["companies"],
+            "annual_average_employees_sum": totals["annual_average_employees"],
+            "total_hours_worked": totals["total_hours_worked"] / totals["companies"],
+            "dafw_num_away": totals["dafw_num_away"] / totals["case_number"],
+            "djtr_num_tr": totals["djtr_num_tr"] / totals["case_number"],
+            "death": totals["death"] / totals["case_number"],
+            "case_number": totals["case_number"],
+        }
+    )
 
     # Calculate injury density using corrected annual_average_employees_sum
     aggregated_data["injury_density"] = np.where(
@@ -306,56 +666,82 @@ def prepare_state_data(df, kpi="incident_rate"):
         0,
     )
 
-    # Merge with the KPI-specific function output
-    return pd.merge(
-        aggregated_data,
-        kpi_name_function_mapping[kpi](df),
-        on="state_code",
-        how="inner",
-    )
+    return pd.concat([aggregated_data, totals[kpi_output_columns(kpi)]], axis=1)
 
 
-def prepare_treemap_data(df, state_code, kpi):
-    temp = df[df["state_code"] == state_code]
+@timed()
+def prepare_treemap_data(spec):
+    dataset = active
+    df = filter_data(spec, dataset)
+    kpi_cube = dataset.kpi_cube
+    state_code, kpi = spec.state, spec.kpi
+    excluded = ["Insufficient info", "Not assigned"]
 
-    # Select the metric function
-    metric_function = kpi_name_function_mapping[kpi]
-    return (
-        temp.query(
-            "soc_description_1 != 'Insufficient info' & soc_description_1 != 'Not assigned'"
-        )
-        .groupby(["soc_description_1", "soc_description_2"], observed=True)
-        .agg(
-            count=(
-                "soc_description_1",
-                "size",
-            ),  # Count the number of rows in each group
-            metric=(
-                "soc_description_1",
-                lambda group: metric_function(temp.loc[group.index])
-                .query(f"state_code == '{state_code}'")
-                .iloc[0, -1],
-            ),
-        )
-        .reset_index()
+    if df is dataset.data:  # No filtering applied, answer from the KPI cube
+        cells = kpi_cube[
+            (kpi_cube["state_code"] == state_code)
+            & ~kpi_cube["soc_description_1"].isin(excluded)
+        ]
+        totals = rollup_cube(cells, soc_levels, observed=True, prefix="soc_")
+        annotate(rows_scanned=len(kpi_cube))
+    else:
+        # Companies count once per SOC group, as if each group was aggregated on its own
+        temp = df[
+            (df["state_code"] == state_code) & ~df["soc_description_1"].isin(excluded)
+        ]
+        totals = aggregate_measures(
+            temp, soc_levels, levels=("soc_",), observed=True
+        ).rename(columns={f"soc_{name}": name for name in company_measures})
+
+    totals = compute_kpis(totals)
+    return pd.DataFrame(
+        {
+            "soc_description_1": totals["soc_description_1"],
+            "soc_description_2": totals["soc_description_2"],
+            "count": totals["case_number"],
+            "metric": totals[kpi],
+        }
     )
 
 
-def prepare_scatter_plot(df, state):
-    # Filter data for the state of Ohio
-    aggregated_data = (
-        df[df["state_code"] == state]
-        .groupby("naics_description_5", observed=True)
-        .agg(
-            {
-                "case_number": "count",
-                "time_started_work": "mean",
-                "time_of_incident": "mean",
-                "establishment_type": lambda x: x.mode().iloc[0],
-            }
+def most_frequent(df, by, column):
+    # Mode of a categorical column within each group from the counts of every
+    # (group, category) pair; ties go to the first category, as with Series.mode
+    counts = (
+        df.groupby([by, column], observed=True)
+        .size()
+        .sort_values(ascending=False, kind="stable")
+    )
+    counts = counts[~counts.index.get_level_values(by).duplicated()]
+    return pd.Series(
+        counts.index.get_level_values(column), index=counts.index.get_level_values(by)
+    )
+
+
+@timed()
+def prepare_scatter_plot(spec):
+    df = filter_data(spec)
+    state = spec.state
+
+    # Average the times as minutes of the day; the times are parsed without a date,
+    # which places them on 1900-01-01
+    rows = df[df["state_code"] == state]
+    industries = rows.groupby("naics_description_5", observed=True)
+    aggregated_data = industries.agg({"case_number": "count"})
+    for column, minutes in time_minute_columns.items():
+        mean_minutes = (
+            rows[minutes]
+            .where(rows[minutes] >= 0)
+            .groupby(rows["naics_description_5"], observed=True)
+            .mean()
         )
-        .reset_index()
+        aggregated_data[column] = pd.Timestamp("1900-01-01") + pd.to_timedelta(
+            mean_minutes, unit="min"
+        )
+    aggregated_data["establishment_type"] = most_frequent(
+        rows, "naics_description_5", "establishment_type"
     )
+    aggregated_data = aggregated_data.reset_index()
 
     # Format time for hover information
     aggregated_data["time_started_work_str"] = aggregated_data[
@@ -369,17 +755,33 @@ def prepare_scatter_plot(df, state):
     return aggregated_data
 
 
-def prepare_stacked_bar_chart(df, state):
-    filtered_data = df.query(
-        "state_code == @state & establishment_type != 'Not Stated' & establishment_type != 'Invalid Entry'"
-    )
+@timed()
+def prepare_stacked_bar_chart(spec):
+    dataset = active
+    df = filter_data(spec, dataset)
+    kpi_cube = dataset.kpi_cube
+    state = spec.state
+
+    query = "state_code == @state & establishment_type != 'Not Stated' & establishment_type != 'Invalid Entry'"
 
     # Aggregate the data: count incidents by type and establishment
-    aggregated_data = (
-        filtered_data.groupby(["incident_outcome", "establishment_type"], observed=True)
-        .size()
-        .reset_index(name="count")
-    )
+    if df is dataset.data:  # No filtering applied, answer from the KPI cube
+        aggregated_data = (
+            kpi_cube.query(query)
+            .groupby(["incident_outcome", "establishment_type"], observed=True)[
+                "case_number"
+            ]
+            .sum()
+            .reset_index(name="count")
+        )
+        annotate(rows_scanned=len(kpi_cube))
+    else:
+        aggregated_data = (
+            df.query(query)
+            .groupby(["incident_outcome", "establishment_type"], observed=True)
+            .size()
+            .reset_index(name="count")
+        )
 
     # Pivot the data for a stacked bar chart structure
     pivot_data = aggregated_data.pivot(
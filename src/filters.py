@@ -0,0 +1,74 @@
+from datetime import datetime
+from typing import NamedTuple, Optional, Tuple
+
+# Selections on the linked views of the metric analysis tab
+drilldown_fields = (
+    "incident_outcome",
+    "soc_description_1",
+    "soc_description_2",
+    "time_started_work",
+    "time_of_incident",
+)
+
+# Drill-down fields each linked view selects on
+view_fields = {
+    "scatter": ("time_started_work", "time_of_incident"),
+    "treemap": ("soc_description_1", "soc_description_2"),
+    "bar": ("incident_outcome",),
+}
+
+
+class FilterSpec(NamedTuple):
+    # Hashable description of a view; its repr is the cache key of the prepare_* functions
+    start_date: str
+    end_date: str
+    incident_types: Tuple[str, ...] = ()
+    state: Optional[str] = None
+    kpi: Optional[str] = None
+    # Drill-down selections from the metric analysis charts
+    incident_outcome: Optional[str] = None
+    soc_description_1: Optional[str] = None
+    soc_description_2: Optional[str] = None
+    time_started_work: Optional[Tuple[float, float]] = None
+    time_of_incident: Optional[Tuple[float, float]] = None
+
+    @classmethod
+    def from_inputs(cls, start_date, end_date, incident_types=None, **selections):
+        # Equivalent inputs map to the same spec: dates are normalised and the
+        # incident types deduplicated and sorted
+        return cls(
+            start_date=datetime.fromisoformat(start_date).isoformat(),
+            end_date=datetime.fromisoformat(end_date).isoformat(),
+            incident_types=tuple(sorted(set(incident_types or ()))),
+            **selections,
+        )
+
+    @property
+    def row_filters(self):
+        # The spec without the fields that only pick what to show from the filtered rows
+        return self._replace(state=None, kpi=None)
+
+    @property
+    def base_filters(self):
+        # The date range and incident types only
+        return self.row_filters._replace(**{field: None for field in drilldown_fields})
+
+    def for_view(self, selection, view):
+        # A linked view is filtered by the selections made on all other views, so that
+        # selections compose without a view filtering itself
+        return self._replace(
+            **{
+                field: tuple(value) if isinstance(value, list) else value
+                for field, value in (selection or {}).items()
+                if field in drilldown_fields and field not in view_fields[view]
+            }
+        )
+
+
+def relayout_range(relayout_data, axis):
+    # Zoomed range of a graph axis as a (min, max) tuple, None when not zoomed
+    low = relayout_data.get(f"{axis}.range[0]", None)
+    high = relayout_data.get(f"{axis}.range[1]", None)
+    if low is None or high is None:
+        return None
+    return float(low), float(high)
@@ -0,0 +1,314 @@
+import argparse
+import os
+import pickle
+import resource
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.schema import check_range, dataset_schema
+
+# Lookup tables of the NAICS and SOC descriptions used by the notebook
+mappings_path = os.environ.get("MAPPINGS_PATH", os.path.join("notebooks", "datasets"))
+
+# Rows of the CSV read at a time; memory use is bounded by it, apart from the 8 bytes
+# per distinct row SeenRows keeps to drop duplicates across chunks
+chunk_size = int(os.environ.get("INGEST_CHUNK_SIZE", 100_000))
+
+categorical_mappings = {
+    "establishment_type": {
+        0.0: "Invalid entry",
+        1.0: "Private industry",
+        2.0: "State government entity",
+        3.0: "Local government entity",
+    },
+    "incident_outcome": {
+        1: "Death",
+        2: "Days away from work (DAFW)",
+        3: "Job transfer or restriction",
+        4: "Other recordable case",
+    },
+    "type_of_incident": {
+        1: "Injury",
+        2: "Skin disorder",
+        3: "Respiratory condition",
+        4: "Poisoning",
+        5: "Hearing Loss",
+        6: "All other illness",
+    },
+}
+
+numeric_columns = [
+    "annual_average_employees",
+    "total_hours_worked",
+    "dafw_num_away",
+    "djtr_num_tr",
+]
+
+# Numeric codes are read as floats and all other columns as strings in every chunk, so
+# that equal rows look the same whichever chunk they are in
+csv_dtypes = defaultdict(
+    lambda: "string",
+    {column: "float64" for column in numeric_columns + list(categorical_mappings)},
+)
+
+codes_to_drop = ["36-83962", "74-187392"]
+states_to_drop = ["AS", "GU", "MP", "VI", "PR"]
+
+
+@lru_cache(maxsize=None)
+def load_mapping(name):
+    with open(os.path.join(mappings_path, name), "rb") as file:
+        return pickle.load(file)
+
+
+def parse_dataset(path, chunksize=chunk_size):
+    return pd.read_csv(
+        path,
+        delimiter=",",
+        encoding="utf-8",
+        dtype=csv_dtypes,
+        index_col="id",
+        chunksize=chunksize,
+    )
+
+
+class SeenRows:
+    # Hashes of the rows kept so far, as sorted runs: every chunk adds a run, and runs
+    # of similar size are merged, so that a hash is copied O(log chunks) times instead
+    # of once per chunk. The hashes grow with the distinct rows of the file, not with
+    # the chunk size
+    def __init__(self):
+        self.runs = []
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+    def contains(self, hashes):
+        # Looked up in sorted order, which touches every run far more locally
+        order = np.argsort(hashes)
+        ordered = hashes[order]
+        found = np.zeros(len(hashes), dtype=bool)
+        for run in self.runs:
+            positions = np.minimum(np.searchsorted(run, ordered), len(run) - 1)
+            found |= run[positions] == ordered
+        contained = np.empty_like(found)
+        contained[order] = found
+        return contained
+
+    def add(self, hashes):
+        run = np.sort(hashes)
+        while self.runs and len(self.runs[-1]) <= len(run):
+            # A stable sort merges the two sorted halves in linear time
+            run = np.sort(np.concatenate([self.runs.pop(), run]), kind="stable")
+        if len(run):
+            self.runs.append(run)
+
+
+def drop_seen(chunk, seen):
+    # Drop rows equal to an earlier row of the file, as drop_duplicates on the whole
+    # file would, and add the hashes of the rows kept to `seen`, a SeenRows
+    hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+    keep = ~pd.Series(hashes).duplicated().to_numpy() & ~seen.contains(hashes)
+    seen.add(hashes[keep])
+    return chunk[keep]
+
+
+def clean_text(column):
+    return (
+        column.astype("string")
+        .str.strip()
+        .str.replace(r"\t", "", regex=True)
+        .str.replace(r"\s+", " ", regex=True)
+    )
+
+
+def preprocess_dataframe(df):
+    # The cleaning of the exploration notebook, limited to the columns the app loads;
+    # duplicate rows are dropped by drop_seen beforehand
+    df = df[
+        (df["annual_average_employees"] > 0)
+        & (df["total_hours_worked"] > 0)
+        & (df["company_name"] != "Santa Maria Healthcare, Inc.").fillna(True)
+    ]
+    hours_employee_ratio = df["total_hours_worked"] / df["annual_average_employees"]
+    df = df[(hours_employee_ratio > 20) & (hours_employee_ratio < 5000)]
+    df = df[df["time_started_work"].notna() & df["time_of_incident"].notna()]
+    df = df[~df["ein"].isin(codes_to_drop)]
+    df = df[~df["state"].isin(states_to_drop)]
+    df = df[df["naics_code"].notna() & df["naics_year"].notna()].copy()
+
+    # Industry descriptions of the 6-digit NAICS codes, looked up once per code
+    naics_mapping = load_mapping("naics_data.pkl")
+    naics_keys = pd.MultiIndex.from_arrays(
+        [df["naics_year"].astype("string"), df["naics_code"].astype("string").str[:6]]
+    )
+    df["naics_description_5"] = pd.Categorical(
+        naics_keys.map(
+            {
+                (year, code): naics_mapping[year].get(code, None)
+                for year, code in naics_keys.unique()
+            }
+        )
+    )
+
+    df["case_number"] = df["case_number"].fillna("Not provided").astype("object")
+    df["company_name"] = clean_text(df["company_name"]).fillna("Not provided")
+    df[numeric_columns] = df[numeric_columns].apply(
+        pd.to_numeric, errors="coerce", downcast="integer"
+    )
+    for column, mapping in categorical_mappings.items():
+        df[column] = df[column].map(mapping).fillna("Not stated").astype("category")
+    df["state_code"] = df["state"].astype("category")
+
+    # Occupation groups of the SOC codes, looked up once per code
+    soc_code = (
+        clean_text(df["soc_code"])
+        .replace("0000", "00-0000")
+        .replace("9999", "99-9999")
+        .fillna("")
+    )
+    category_dict = load_mapping("code_to_description.pkl")
+    for level in [1, 2]:
+        descriptions = {
+            code: category_dict.get(code, ["Not assigned"] * 3)[level - 1]
+            for code in soc_code.unique()
+        }
+        df[f"soc_description_{level}"] = soc_code.map(descriptions).astype("category")
+
+    df["date_of_incident"] = pd.to_datetime(
+        df["date_of_incident"], format="%m/%d/%Y", errors="coerce"
+    )
+    df["death"] = pd.to_datetime(
+        df["date_of_death"], format="%m/%d/%Y", errors="coerce"
+    ).notna()
+    for column in ["time_started_work", "time_of_incident"]:
+        df[column] = pd.to_datetime(df[column], format="%H:%M:%S.%f", errors="coerce")
+
+    return df[dataset_schema.names].reset_index(drop=True)
+
+
+def reduce_mem_usage(df):
+    # Downcast the numeric columns to the types of the dataset schema; missing day
+    # counts are taken as none
+    for column in numeric_columns:
+        dtype = dataset_schema.field(column).type.to_pandas_dtype()
+        values = df[column].fillna(0)
+        check_range(values, dtype, column)
+        df[column] = values.astype(dtype)
+    return df
+
+
+def convert_csv(csv_path, parquet_path, chunksize=chunk_size):
+    # Stream the CSV into a parquet file with a row group per chunk. Chunks are written
+    # to a temporary file first; once all categories are known, its row groups are
+    # rewritten with the same sorted categories, as if the file was processed at once
+    started = time.perf_counter()
+    temp_path = f"{parquet_path}.tmp"
+    seen = SeenRows()
+    categories = {
+        field.name: set()
+        for field in dataset_schema
+        if pa.types.is_dictionary(field.type)
+    }
+    rows_read = rows_written = 0
+    with pq.ParquetWriter(temp_path, dataset_schema) as writer:
+        for chunk in parse_dataset(csv_path, chunksize):
+            rows_read += len(chunk)
+            chunk = drop_seen(chunk, seen)
+            chunk = reduce_mem_usage(preprocess_dataframe(chunk))
+            for column, values in categories.items():
+                values.update(chunk[column].dropna().unique())
+            writer.write_table(
+                pa.Table.from_pandas(chunk, schema=dataset_schema, preserve_index=False)
+            )
+            rows_written += len(chunk)
+            print(
+                f">>> {rows_read} rows read, {rows_written} kept, "
+                f"{rows_read / (time.perf_counter() - started):.0f} rows/s"
+            )
+
+    temp_file = pq.ParquetFile(temp_path)
+    dtypes = {
+        column: pd.CategoricalDtype(sorted(values))
+        for column, values in categories.items()
+    }
+    with pq.ParquetWriter(parquet_path, dataset_schema) as writer:
+        for row_group in range(temp_file.num_row_groups):
+            chunk = temp_file.read_row_group(row_group).to_pandas().astype(dtypes)
+            writer.write_table(
+                pa.Table.from_pandas(chunk, schema=dataset_schema, preserve_index=False)
+            )
+    os.remove(temp_path)
+
+    elapsed = time.perf_counter() - started
+    print(
+        f">>> Converted {rows_read} rows of {csv_path} to {rows_written} rows in "
+        f"{elapsed:.2f}s: {rows_read / elapsed:.0f} rows/s, "
+        f"{os.path.getsize(csv_path) / 1024**2 / elapsed:.1f} MB/s, peak memory "
+        f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB"
+    )
+    return rows_written
+
+
+def partition_name(csv_path):
+    import src.data
+
+    # Partitions are numbered so that their names sort in the order they were added
+    release = os.path.splitext(os.path.basename(csv_path))[0]
+    partitions = src.data.dataset_files()[1:]
+    for path in partitions:
+        if os.path.basename(path).split("-", 1)[1] == f"{release}.parquet":
+            raise ValueError(f"Release {release} was already ingested as {path}")
+    return f"{len(partitions) + 1:04d}-{release}.parquet"
+
+
+def ingest_release(csv_path, chunksize=chunk_size):
+    import src.data
+    from src.snapshot import write_snapshot
+
+    started = time.perf_counter()
+    path = os.path.join(src.data.partitions_path, partition_name(csv_path))
+    os.makedirs(src.data.partitions_path, exist_ok=True)
+
+    # The partition only becomes part of the dataset once the release was merged
+    convert_csv(csv_path, f"{path}.part", chunksize)
+    rows = pd.read_parquet(f"{path}.part")
+    state = src.data.append_state(src.data.state, rows)
+    os.replace(f"{path}.part", path)
+
+    # Running apps swap the release in once the snapshot of its version is written
+    dataset_version = src.data.dataset_fingerprint(src.data.dataset_files())
+    write_snapshot(state, src.data.snapshot_path, dataset_version)
+    src.data.activate_state(state, dataset_version)
+    print(
+        f">>> Ingested {len(rows)} rows of {csv_path} as dataset {dataset_version} "
+        f"in {time.perf_counter() - started:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Append OSHA ITA case detail releases to the dataset"
+    )
+    parser.add_argument("csv_paths", nargs="+", help="CSV files of the releases")
+    parser.add_argument(
+        "--output",
+        help="only convert a single CSV file to this parquet file, e.g. a new base "
+        "dataset, without adding it to the dataset",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=chunk_size, help="rows read at a time"
+    )
+    args = parser.parse_args()
+    if args.output:
+        (csv_path,) = args.csv_paths
+        convert_csv(csv_path, args.output, args.chunk_size)
+    else:
+        for csv_path in args.csv_paths:
+            ingest_release(csv_path, args.chunk_size)
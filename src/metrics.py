@@ -0,0 +1,279 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import flask
+import pandas as pd
+
+# Every worker process writes its totals to a file of its own here, and /metrics adds
+# up the files of all workers on the host, like the file-system cache does
+metrics_dir = os.environ.get(
+    "METRICS_DIR", os.path.join(tempfile.gettempdir(), "workplace-safety-metrics")
+)
+
+# Set JSON_LOGS to log a JSON line for every finished span to stderr
+json_logs = bool(os.environ.get("JSON_LOGS"))
+
+# Upper bounds in seconds of the latency histogram buckets
+buckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+# Totals of this process per (stage, cache) label pair: the count of each bucket, the
+# count and the sum of the durations and the rows scanned and returned
+totals = {}
+totals_lock = threading.Lock()
+
+# Held while a thread writes the totals file of this process, so that the threads of a
+# worker never replace it while another one writes it
+write_lock = threading.Lock()
+
+# Counts of this process per (event, outcome), e.g. of the prefetched views
+events = {}
+
+# Open spans of the current thread, innermost last
+spans = threading.local()
+
+# Requests this process is serving, which background work waits for
+in_flight = 0
+
+
+def count_request():
+    global in_flight
+    with totals_lock:
+        in_flight += 1
+    flask.g.counted = True
+
+
+def uncount_request(_):
+    # Teardown also runs for requests an earlier before_request handler failed
+    global in_flight
+    if flask.g.pop("counted", False):
+        with totals_lock:
+            in_flight -= 1
+
+
+def track_requests(flask_app):
+    flask_app.before_request(count_request)
+    flask_app.teardown_request(uncount_request)
+
+
+@contextmanager
+def job_in_flight():
+    # A background job counts as a request while its thread renders the response
+    global in_flight
+    with totals_lock:
+        in_flight += 1
+    try:
+        yield
+    finally:
+        with totals_lock:
+            in_flight -= 1
+
+
+def requests_in_flight():
+    return in_flight
+
+
+def lower_thread_priority():
+    # Background threads of a worker run at the lowest priority, so that the threads
+    # serving requests get the CPU first; not every platform allows it
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+
+
+def open_spans():
+    if not hasattr(spans, "stack"):
+        spans.stack = []
+    return spans.stack
+
+
+def annotate(**fields):
+    # Add fields, e.g. the rows scanned, to the innermost open span of the thread
+    stack = open_spans()
+    if stack:
+        stack[-1].update(fields)
+
+
+@contextmanager
+def span(stage, **fields):
+    # Time a callback or a stage of one; the fields end up in the JSON log line
+    stack = open_spans()
+    record = {"stage": stage, "cache": "none", **fields}
+    if stack:
+        record["parent"] = stack[-1]["stage"]
+    stack.append(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except Exception as error:
+        record["error"] = type(error).__name__
+        raise
+    finally:
+        record["seconds"] = time.perf_counter() - started
+        stack.pop()
+        observe(record)
+        if not stack:
+            write_totals()
+
+
+def describe(args):
+    # Arguments of a span in a loggable form: filter specs by field and frames by size
+    return [
+        (
+            f"<{len(arg)} rows>"
+            if isinstance(arg, pd.DataFrame)
+            else arg._asdict() if hasattr(arg, "_asdict") else arg
+        )
+        for arg in args
+    ]
+
+
+def timed(cache=None):
+    # Decorator running a function in a span named after it. A frame as first argument
+    # counts as the rows scanned and a returned frame as the rows returned
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            fields = {"inputs": describe(args)} if json_logs else {}
+            if cache:
+                fields["cache"] = cache
+            if args and isinstance(args[0], pd.DataFrame):
+                fields["rows_scanned"] = len(args[0])
+            with span(function.__name__, **fields) as record:
+                result = function(*args, **kwargs)
+                if isinstance(result, pd.DataFrame):
+                    record["rows_returned"] = len(result)
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def observe(record):
+    key = (record["stage"], record["cache"])
+    with totals_lock:
+        counts = totals.setdefault(key, [0] * (len(buckets) + 4))
+        for index, bound in enumerate(buckets):
+            if record["seconds"] <= bound:
+                counts[index] += 1
+        counts[-4] += 1
+        counts[-3] += record["seconds"]
+        counts[-2] += record.get("rows_scanned", 0)
+        counts[-1] += record.get("rows_returned", 0)
+    if json_logs:
+        print(
+            json.dumps(
+                {"time": time.time(), "pid": os.getpid(), **record}, default=str
+            ),
+            file=sys.stderr,
+        )
+
+
+def count_event(event, outcome):
+    with totals_lock:
+        events[event, outcome] = events.get((event, outcome), 0) + 1
+    if not open_spans():
+        write_totals()
+
+
+def write_totals():
+    # Written after every request, so a scrape through any worker sees them all. A
+    # failed write only leaves the totals of the previous one, never a failed request
+    path = os.path.join(metrics_dir, f"{os.getpid()}.json")
+    with write_lock:
+        with totals_lock:
+            rows = [[stage, cache, counts] for (stage, cache), counts in totals.items()]
+            counts = [[event, outcome, n] for (event, outcome), n in events.items()]
+        try:
+            os.makedirs(metrics_dir, exist_ok=True)
+            with open(f"{path}.tmp", "w") as file:
+                json.dump({"totals": rows, "events": counts}, file)
+            os.replace(f"{path}.tmp", path)
+        except OSError as error:
+            print(f">>> Writing the metrics to {path} failed: {error!r}")
+
+
+def reset_metrics():
+    # Drop the totals of earlier runs; called once by the server before forking workers
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def read_totals():
+    combined, combined_events = {}, {}
+    for name in os.listdir(metrics_dir) if os.path.isdir(metrics_dir) else []:
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(metrics_dir, name)) as file:
+                written = json.load(file)
+        except (OSError, ValueError):
+            continue
+        for stage, cache, counts in written["totals"]:
+            combined[stage, cache] = [
+                total + count
+                for total, count in zip(
+                    combined.get((stage, cache), [0] * len(counts)), counts
+                )
+            ]
+        for event, outcome, count in written["events"]:
+            combined_events[event, outcome] = (
+                combined_events.get((event, outcome), 0) + count
+            )
+    return combined, combined_events
+
+
+def metrics_text():
+    # The totals of all workers in the Prometheus text exposition format
+    combined, combined_events = read_totals()
+    lines = [
+        "# HELP dashboard_stage_seconds Time spent in a callback or a prepare_* or "
+        "create_* stage",
+        "# TYPE dashboard_stage_seconds histogram",
+    ]
+    for (stage, cache), counts in sorted(combined.items()):
+        labels = f'stage="{stage}",cache="{cache}"'
+        for bound, count in zip(buckets, counts):
+            lines.append(
+                f'dashboard_stage_seconds_bucket{{{labels},le="{bound}"}} {count}'
+            )
+        lines.append(
+            f'dashboard_stage_seconds_bucket{{{labels},le="+Inf"}} {counts[-4]}'
+        )
+        lines.append(f"dashboard_stage_seconds_sum{{{labels}}} {counts[-3]}")
+        lines.append(f"dashboard_stage_seconds_count{{{labels}}} {counts[-4]}")
+    for index, name, description in [
+        (-2, "scanned", "Rows a stage aggregated or filtered"),
+        (-1, "returned", "Rows of the frames a stage returned"),
+    ]:
+        lines.append(f"# HELP dashboard_stage_rows_{name}_total {description}")
+        lines.append(f"# TYPE dashboard_stage_rows_{name}_total counter")
+        for (stage, cache), counts in sorted(combined.items()):
+            lines.append(
+                f'dashboard_stage_rows_{name}_total{{stage="{stage}",cache="{cache}"}} '
+                f"{counts[index]}"
+            )
+    for event in sorted({event for event, _ in combined_events}):
+        lines.append(f"# HELP dashboard_{event}_total Outcomes of {event} by kind")
+        lines.append(f"# TYPE dashboard_{event}_total counter")
+        for (name, outcome), count in sorted(combined_events.items()):
+            if name == event:
+                lines.append(f'dashboard_{event}_total{{outcome="{outcome}"}} {count}')
+    computed = combined_events.get(("prefetch", "computed"), 0)
+    if computed:
+        lines.append(
+            "# HELP dashboard_prefetch_hit_ratio Prefetched views a request used"
+        )
+        lines.append("# TYPE dashboard_prefetch_hit_ratio gauge")
+        lines.append(
+            "dashboard_prefetch_hit_ratio "
+            f"{combined_events.get(('prefetch', 'used'), 0) / computed}"
+        )
+    return "\n".join(lines) + "\n"
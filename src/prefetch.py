@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+from collections import deque
+
+import flask
+
+from src.cache import (
+    cache,
+    cache_key,
+    prefetch_marker,
+    prepare_radar_data_cached,
+    prepare_scatter_plot_cached,
+    prepare_stacked_bar_chart_cached,
+    prepare_treemap_data_cached,
+)
+from src.filters import FilterSpec
+from src.mappings import state_neighbors
+from src.metrics import count_event, lower_thread_priority, requests_in_flight
+
+# Set PREFETCH=0 to compute no view before it is asked for
+prefetch_enabled = os.environ.get("PREFETCH", "1") != "0"
+
+# Views waiting to be prefetched; the newest are computed first and, once the queue
+# is full, the oldest are dropped
+queue_size = int(os.environ.get("PREFETCH_QUEUE", 16))
+
+# Share of a CPU the prefetcher may use: after each view it sleeps long enough
+cpu_share = float(os.environ.get("PREFETCH_CPU_SHARE", 0.25))
+
+# Load average per CPU above which the queued views are dropped instead of computed
+max_load = float(os.environ.get("PREFETCH_MAX_LOAD", 0.75))
+
+pending = deque()
+pending_changed = threading.Condition()
+prefetcher = None
+
+
+def host_busy():
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1) > max_load
+    except OSError:
+        return False
+
+
+def next_views(render, inputs):
+    # The views a user likely opens after these inputs of update_tab_contents, likeliest
+    # first, as (function, arguments): the state tab for the worst KPI of the radar, as
+    # its annotation names it, or the charts for the top SOC of the treemap, then the
+    # tab for each neighbouring state
+    tab_name, start_date, end_date, incident_types, kpi, dropdown_state = inputs
+    spec = FilterSpec.from_inputs(start_date, end_date, incident_types)
+    state_spec = spec._replace(state=dropdown_state)
+    views = []
+
+    if tab_name == "state_analysis_tab":
+        radar = prepare_radar_data_cached(state_spec)
+        if radar["value"].notna().any():
+            worst_kpi = radar.loc[radar["value"].idxmax(), "kpi"]
+            if worst_kpi != kpi:
+                views.append((render, inputs[:4] + (worst_kpi, dropdown_state)))
+
+    if tab_name == "metric_analysis_tab":
+        treemap = prepare_treemap_data_cached(state_spec._replace(kpi="incident_rate"))
+        if not treemap.empty:
+            counts = treemap.groupby("soc_description_1", observed=True)["count"].sum()
+            selection = {"soc_description_1": counts.idxmax()}
+            views.append(
+                (
+                    prepare_stacked_bar_chart_cached,
+                    (state_spec.for_view(selection, "bar"),),
+                )
+            )
+            views.append(
+                (
+                    prepare_scatter_plot_cached,
+                    (state_spec.for_view(selection, "scatter"),),
+                )
+            )
+
+    views += [
+        (render, inputs[:5] + (state,))
+        for state in state_neighbors.get(dropdown_state, [])
+    ]
+    return views
+
+
+class Prefetcher(threading.Thread):
+    # Computes queued views at the lowest priority, while the process serves no request
+    def __init__(self, flask_app):
+        super().__init__(daemon=True, name="prefetcher")
+        self.flask_app = flask_app
+        self.pid = os.getpid()
+
+    def run(self):
+        lower_thread_priority()
+        with self.flask_app.app_context():
+            while True:
+                with pending_changed:
+                    while not pending:
+                        pending_changed.wait()
+                    task = pending.pop()
+                while requests_in_flight():
+                    time.sleep(0.05)
+                if host_busy():
+                    cancel(task)
+                    continue
+                try:
+                    self.prefetch(*task)
+                except Exception as error:
+                    print(
+                        f">>> Prefetching {task[1].__name__}{task[2]} failed: {error!r}"
+                    )
+
+    def prefetch(self, kind, function, args):
+        if kind == "plan":
+            schedule(next_views(function, args))
+            return
+        key = cache_key(function, *args)
+        if cache.cache.has(key):
+            count_event("prefetch", "cached")
+            return
+        started = time.thread_time()
+        function(*args)
+        cache.set(prefetch_marker(key), True)
+        count_event("prefetch", "computed")
+        spent = time.thread_time() - started
+        time.sleep(spent * (1 - cpu_share) / cpu_share)
+
+
+def cancel(task):
+    # Under load the queue is dropped; the views are computed if they are asked for
+    with pending_changed:
+        dropped = [task] + list(pending)
+        pending.clear()
+    for _ in dropped:
+        count_event("prefetch", "cancelled")
+
+
+def schedule(views, kind="view"):
+    global prefetcher
+    # The queue is taken from its end, so the likeliest view goes last
+    with pending_changed:
+        for function, args in reversed(views):
+            task = (kind, function, args)
+            if task in pending:
+                continue
+            if len(pending) == queue_size:
+                pending.popleft()
+                count_event("prefetch", "dropped")
+            pending.append(task)
+        pending_changed.notify()
+        # A worker forked from a process with a prefetcher starts one of its own
+        if prefetcher is None or prefetcher.pid != os.getpid():
+            prefetcher = Prefetcher(flask.current_app._get_current_object())
+            prefetcher.start()
+
+
+def prefetch_next_views(render, inputs):
+    # Called in the worker as update_tab_contents is started for these inputs; the
+    # likely next views are planned and computed in the background
+    if prefetch_enabled:
+        schedule([(render, tuple(inputs))], kind="plan")
@@ -0,0 +1,201 @@
+import cProfile
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import pstats
+import re
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+
+import flask
+
+# Profiles of the profiled requests are written here
+profile_dir = os.environ.get(
+    "PROFILE_DIR", os.path.join(tempfile.gettempdir(), "workplace-safety-profiles")
+)
+
+# Callbacks whose every request runs under cProfile, by function name, or "all"
+profile_callbacks = set(
+    filter(None, os.environ.get("PROFILE_CALLBACKS", "").split(","))
+)
+
+# Requests whose X-Profile header carries this token run under cProfile as well
+profile_token = os.environ.get("PROFILE_TOKEN")
+
+# Requests slower than this many seconds leave the profile of a sampling profiler
+# behind; it looks at the stack every PROFILE_SAMPLE_INTERVAL seconds, which costs
+# little enough to run for every request
+slow_seconds = float(os.environ.get("PROFILE_SLOW_SECONDS", 0))
+sample_interval = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", 0.005))
+
+
+# Numbers the profiles of this process, so that requests of the same second never
+# overwrite each other's profile
+profile_numbers = itertools.count(1)
+
+
+def profile_path(callback, inputs, extension):
+    # Named after the time, the process and its count of profiles, the callback and its
+    # input values, cut short and told apart by a digest of them
+    values = json.dumps(inputs, sort_keys=True, default=str)
+    summary = re.sub(r"[^A-Za-z0-9.-]+", "_", values).strip("_")[:80]
+    digest = hashlib.sha1(values.encode()).hexdigest()[:8]
+    name = (
+        f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}-{next(profile_numbers)}-"
+        f"{callback}-{summary}-{digest}.{extension}"
+    )
+    os.makedirs(profile_dir, exist_ok=True)
+    return os.path.join(profile_dir, name)
+
+
+def write_callgrind(profiler, path):
+    # cProfile stats in the callgrind format of KCachegrind and QCachegrind, in
+    # microseconds; every call edge is listed under the calling function
+    stats = pstats.Stats(profiler).stats
+    callees = {}
+    for function, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((function, edge))
+
+    lines = ["events: Microseconds"]
+    for function, (_, _, self_time, _, _) in stats.items():
+        file, line, name = function
+        lines += [f"fl={file}", f"fn={name}:{line}", f"{line} {int(self_time * 1e6)}"]
+        for (callee_file, callee_line, callee_name), edge in callees.get(function, []):
+            lines += [
+                f"cfl={callee_file}",
+                f"cfn={callee_name}:{callee_line}",
+                f"calls={edge[1]} {callee_line}",
+                f"{line} {int(edge[3] * 1e6)}",
+            ]
+    with open(path, "w") as file:
+        file.write("\n".join(lines) + "\n")
+
+
+class StackSampler(threading.Thread):
+    # Records the stack of a thread at regular intervals while it handles a request
+    def __init__(self, thread_id):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(sample_interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            self.samples.append((time.perf_counter(), stack[::-1]))
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def write_speedscope(samples, started, path, name):
+    # The samples as a sampled profile of speedscope, weighted by the time between them
+    frames, indexes, stacks, weights = [], {}, [], []
+    previous = started
+    for sampled, stack in samples:
+        for frame in stack:
+            if frame not in indexes:
+                indexes[frame] = len(frames)
+                frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+        stacks.append([indexes[frame] for frame in stack])
+        weights.append(sampled - previous)
+        previous = sampled
+    with open(path, "w") as file:
+        json.dump(
+            {
+                "$schema": "https://www.speedscope.app/file-format-schema.json",
+                "shared": {"frames": frames},
+                "profiles": [
+                    {
+                        "type": "sampled",
+                        "name": name,
+                        "unit": "seconds",
+                        "startValue": 0,
+                        "endValue": sum(weights),
+                        "samples": stacks,
+                        "weights": weights,
+                    }
+                ],
+                "name": name,
+                "exporter": "workplace-safety-tracker",
+            },
+            file,
+        )
+
+
+def wants_profile(callback, header=""):
+    # Whether a run of the callback goes under cProfile: by its name, or because its
+    # request sent the token in its X-Profile header
+    return (
+        "all" in profile_callbacks
+        or callback in profile_callbacks
+        or bool(
+            profile_token
+            and hmac.compare_digest(header.encode(), profile_token.encode())
+        )
+    )
+
+
+def run_profiled(callback, inputs, profiled, function, *args, **kwargs):
+    # Runs the function under cProfile if profiled, else with PROFILE_SLOW_SECONDS under
+    # the stack sampler, and writes its profile
+    if profiled:
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(function, *args, **kwargs)
+        finally:
+            path = profile_path(callback, inputs, "callgrind")
+            write_callgrind(profiler, path)
+            print(f">>> Wrote profile of {callback} to {path}")
+
+    if not slow_seconds:
+        return function(*args, **kwargs)
+    sampler = StackSampler(threading.get_ident())
+    started = time.perf_counter()
+    sampler.start()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        sampler.stop()
+        elapsed = time.perf_counter() - started
+        if elapsed > slow_seconds:
+            path = profile_path(callback, inputs, "speedscope.json")
+            write_speedscope(sampler.samples, started, path, callback)
+            print(f">>> {callback} took {elapsed:.2f}s, wrote its profile to {path}")
+
+
+def profile_requests(dash_app):
+    # Wrap the view that runs the callbacks; nothing is wrapped unless a profiling
+    # option is set, so that requests pay nothing for it otherwise. Background
+    # callbacks are profiled in their jobs, not as their jobs are started and polled
+    if not (profile_callbacks or profile_token or slow_seconds):
+        return
+    server = dash_app.server
+    endpoint = f"{dash_app.config.routes_pathname_prefix}_dash-update-component"
+    view = server.view_functions[endpoint]
+
+    @wraps(view)
+    def profiled_view(*args, **kwargs):
+        body = flask.request.get_json(silent=True) or {}
+        entry = dash_app.callback_map.get(body.get("output"), {})
+        if entry.get("long"):
+            return view(*args, **kwargs)
+        callback = getattr(entry.get("callback"), "__name__", "unknown")
+        inputs = [item.get("value") for item in body.get("inputs", [])]
+        profiled = wants_profile(callback, flask.request.headers.get("X-Profile", ""))
+        return run_profiled(callback, inputs, profiled, view, *args, **kwargs)
+
+    server.view_functions[endpoint] = profiled_view
@@ -0,0 +1,128 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Columns of the processed dataset as stored in parquet. Every chunk written by the
+# ingestion is cast to this schema, so that all row groups of the parquet share it
+category = pa.dictionary(pa.int32(), pa.string())
+dataset_schema = pa.schema(
+    [
+        ("case_number", pa.string()),
+        ("company_name", pa.string()),
+        ("state_code", category),
+        ("type_of_incident", category),
+        ("total_hours_worked", pa.int32()),
+        ("annual_average_employees", pa.int32()),
+        ("death", pa.bool_()),
+        ("dafw_num_away", pa.int16()),
+        ("djtr_num_tr", pa.int16()),
+        ("date_of_incident", pa.timestamp("ns")),
+        ("soc_description_1", category),
+        ("soc_description_2", category),
+        ("naics_description_5", category),
+        ("time_started_work", pa.timestamp("ns")),
+        ("time_of_incident", pa.timestamp("ns")),
+        ("establishment_type", category),
+        ("incident_outcome", category),
+    ]
+)
+
+# The times of day are only kept as the minute of the day they fall in
+time_minute_columns = {
+    "time_started_work": "start_minute",
+    "time_of_incident": "incident_minute",
+}
+
+# Types of the columns the app loads, enforced whatever types the parquet files have.
+# Case numbers are only counted and stay in Arrow memory; company names repeat on every
+# case of a company and are categories like the descriptions
+column_dtypes = {
+    "case_number": pd.ArrowDtype(pa.string()),
+    "company_name": "category",
+    "state_code": "category",
+    "type_of_incident": "category",
+    "total_hours_worked": np.int32,
+    "annual_average_employees": np.int32,
+    "death": bool,
+    "dafw_num_away": np.int16,
+    "djtr_num_tr": np.int16,
+    "date_of_incident": "datetime64[ns]",
+    "soc_description_1": "category",
+    "soc_description_2": "category",
+    "naics_description_5": "category",
+    "establishment_type": "category",
+    "incident_outcome": "category",
+    "start_minute": np.int16,
+    "incident_minute": np.int16,
+}
+
+
+def minute_of_day(times):
+    # -1 marks a missing time
+    return (times.dt.hour * 60 + times.dt.minute).fillna(-1).astype(np.int16)
+
+
+def check_range(values, dtype, column):
+    # Integer casts wrap around silently, so values that do not fit are an error
+    limits = np.iinfo(dtype)
+    if len(values) and (values.min() < limits.min or values.max() > limits.max):
+        raise ValueError(f"Values of {column} do not fit in {np.dtype(dtype)}")
+
+
+def enforce_schema(df):
+    # The columns of column_dtypes in their types; the times are replaced by minutes
+    df = df.assign(
+        **{
+            minutes: minute_of_day(df[column])
+            for column, minutes in time_minute_columns.items()
+            if column in df
+        }
+    )
+    missing = [column for column in column_dtypes if column not in df]
+    if missing:
+        raise ValueError(f"The dataset lacks the columns {', '.join(missing)}")
+    for column, dtype in column_dtypes.items():
+        if dtype in (np.int16, np.int32):
+            check_range(df[column], dtype, column)
+    df = df[list(column_dtypes)].astype(column_dtypes)
+
+    # Categories are Python strings, whether the parquet held pandas, Arrow or object
+    # strings, so that the categories of all files can be combined
+    for column, dtype in column_dtypes.items():
+        categories = df[column].cat.categories if dtype == "category" else None
+        if categories is not None and categories.dtype != object:
+            df[column] = pd.Categorical.from_codes(
+                df[column].cat.codes, categories.astype(object)
+            )
+    return df
+
+
+def memory_report(before, after):
+    # Bytes of every column as read and as loaded
+    report = pd.DataFrame(
+        {
+            "before": before.memory_usage(index=False, deep=True),
+            "after": after.memory_usage(index=False, deep=True),
+        }
+    )
+    report.loc["total"] = report.sum()
+    return report.fillna(0).astype(np.int64)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Show the memory the dataset takes as read and as loaded"
+    )
+    parser.add_argument(
+        "path",
+        nargs="?",
+        default=os.environ.get("DATASET_PATH", "datasets/processed_data copy.parquet"),
+    )
+    args = parser.parse_args()
+
+    dataset = pd.read_parquet(args.path)
+    report = memory_report(dataset, enforce_schema(dataset))
+    print((report / 1024**2).round(2).rename(columns=lambda name: f"{name} MB"))
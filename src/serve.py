@@ -0,0 +1,41 @@
+import os
+
+from gunicorn.app.base import BaseApplication
+
+from src.metrics import reset_metrics
+from src.warmup import start_warmup
+
+
+class PreloadedApplication(BaseApplication):
+    # The WSGI app, and with it the dataset, is loaded once in the master process;
+    # forked workers share those pages instead of each loading their own copy
+    def __init__(self, wsgi_app, options):
+        self.wsgi_app = wsgi_app
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.wsgi_app
+
+
+def serve(wsgi_app):
+    options = {
+        "bind": f"{os.environ.get('HOST', '127.0.0.1')}:{os.environ.get('PORT', '5000')}",
+        "workers": int(os.environ.get("WORKERS", os.cpu_count() or 1)),
+        "timeout": int(os.environ.get("WORKER_TIMEOUT", 120)),
+        "preload_app": True,
+        # Each worker starts warming the cache once it is ready to serve
+        "post_worker_init": lambda worker: start_warmup(wsgi_app),
+    }
+    reset_metrics()
+    PreloadedApplication(wsgi_app, options).run()
+
+
+if __name__ == "__main__":
+    from application import application
+
+    serve(application)
@@ -0,0 +1,107 @@
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.storage import read_arrow, write_arrow
+
+# Bump whenever the layout of the snapshot or of the state it holds changes
+snapshot_format = 5
+
+snapshot_frames = ["data", "companies", "kpi_cube", "region_safety_score"]
+snapshot_values = [
+    "incident_types",
+    "state_codes",
+    "min_metric_values",
+    "max_metric_values",
+    "mean_metric_values",
+]
+
+
+def write_snapshot(state, path, dataset_version):
+    # The snapshot is built in a directory of its own next to the target; path is a
+    # symlink to it, replaced in a single step once it is complete, so that readers
+    # see either the previous snapshot or the new one
+    temp_path = f"{path}.{dataset_version}-{os.getpid()}-{time.time_ns()}"
+    os.makedirs(temp_path)
+    for name in snapshot_frames:
+        write_arrow(state[name], os.path.join(temp_path, f"{name}.arrow"))
+
+    # Row ids of all incident types in one array, with each type's slice in the manifest
+    type_rows = state["incident_type_rows"]
+    offsets = np.cumsum([0] + [len(rows) for rows in type_rows.values()])
+    np.save(
+        os.path.join(temp_path, "incident_type_rows.npy"),
+        np.concatenate(list(type_rows.values())),
+    )
+
+    manifest = {
+        "format": snapshot_format,
+        "dataset_version": dataset_version,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "min_date": state["min_date"].isoformat(),
+        "max_date": state["max_date"].isoformat(),
+        "incident_type_rows": {
+            incident_type: [int(start), int(stop)]
+            for incident_type, start, stop in zip(type_rows, offsets, offsets[1:])
+        },
+        **{name: state[name] for name in snapshot_values},
+    }
+    with open(os.path.join(temp_path, "manifest.json"), "w") as file:
+        json.dump(manifest, file, indent=2)
+
+    previous = os.path.realpath(path) if os.path.islink(path) else None
+    if os.path.isdir(path) and previous is None:  # Written before snapshots were linked
+        shutil.rmtree(path)
+    link = f"{temp_path}.link"
+    os.symlink(os.path.basename(temp_path), link)
+    os.replace(link, path)
+    if previous:
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+def read_snapshot(path, dataset_version):
+    # Returns None unless the snapshot was built from this version of the dataset. A
+    # snapshot replaced while it is read is gone, and is read again at the next check
+    try:
+        return read_snapshot_files(os.path.realpath(path), dataset_version)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def read_snapshot_files(path, dataset_version):
+    with open(os.path.join(path, "manifest.json")) as file:
+        manifest = json.load(file)
+    if (
+        manifest["format"] != snapshot_format
+        or manifest["dataset_version"] != dataset_version
+    ):
+        return None
+
+    state = {
+        name: read_arrow(os.path.join(path, f"{name}.arrow"))
+        for name in snapshot_frames
+    }
+    state.update({name: manifest[name] for name in snapshot_values})
+    state["min_date"] = pd.Timestamp(manifest["min_date"])
+    state["max_date"] = pd.Timestamp(manifest["max_date"])
+
+    rows = np.load(os.path.join(path, "incident_type_rows.npy"), mmap_mode="r")
+    state["incident_type_rows"] = {
+        incident_type: rows[start:stop]
+        for incident_type, (start, stop) in manifest["incident_type_rows"].items()
+    }
+    return state
+
+
+if __name__ == "__main__":
+    import src.data
+
+    dataset = src.data.active
+    write_snapshot(dataset.state, src.data.snapshot_path, dataset.version)
+    print(
+        f">>> Wrote snapshot of dataset {dataset.version} to {src.data.snapshot_path}"
+    )
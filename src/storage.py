@@ -0,0 +1,34 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+# Strings stay in Arrow memory instead of being decoded into Python objects
+arrow_string_types = {
+    pa.string(): pd.ArrowDtype(pa.string()),
+    pa.large_string(): pd.ArrowDtype(pa.large_string()),
+}
+
+
+def write_arrow(df, path, metadata=None):
+    # A single uncompressed record batch, so readers can map every column without copying
+    table = pa.Table.from_pandas(df, preserve_index=False).combine_chunks()
+    table = table.replace_schema_metadata(
+        {
+            **table.schema.metadata,
+            **{key: str(value) for key, value in (metadata or {}).items()},
+        }
+    )
+
+    # Write next to the target and rename, so a running reader never sees a partial file
+    temp_path = f"{path}.tmp"
+    with pa.OSFile(temp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=max(len(df), 1))
+    os.replace(temp_path, path)
+
+
+def read_arrow(path):
+    # Columns are views into the read-only memory map, shared by every process mapping the file
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return table.to_pandas(split_blocks=True, types_mapper=arrow_string_types.get)
@@ -1,9 +1,12 @@
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from dash import Patch
 from plotly_resampler import FigureResampler
 
 from src.mappings import dropdown_options, state_map
+from src.metrics import timed
 
 font_settings = {
     "size": 16,
@@ -21,6 +24,7 @@ def preprocess_radar_data(df):
     return pd.concat([df, df.iloc[[0]]], ignore_index=True)
 
 
+@timed()
 def create_radar_chart(df, dropdown_state):
     fig = go.Figure()
 
@@ -95,6 +99,7 @@ def create_radar_chart(df, dropdown_state):
     return fig
 
 
+@timed()
 def create_map(df, kpi="incident_rate", selected_state=None):
     kpi_name = dropdown_options[kpi]
     background_color = "white"
@@ -184,6 +189,7 @@ def create_map(df, kpi="incident_rate", selected_state=None):
     return fig
 
 
+@timed()
 def create_splom(df, kpi, selected_state=None):
     fig = FigureResampler(go.Figure())
     df = df.sort_values(by=kpi, ascending=True).copy()
@@ -263,6 +269,7 @@ def create_splom(df, kpi, selected_state=None):
     return fig
 
 
+@timed()
 def create_treemap(df, kpi, selected_state):
     kpi_name = dropdown_options[kpi]
     n = 0.7
@@ -326,6 +333,7 @@ def create_treemap(df, kpi, selected_state):
     return fig
 
 
+@timed()
 def create_scatter_plot(df, selected_state):
     fig = FigureResampler(go.Figure())
 
@@ -377,6 +385,7 @@ def create_scatter_plot(df, selected_state):
     return fig
 
 
+@timed()
 def create_stacked_bar_chart(df, selected_state):
     fig = FigureResampler(go.Figure())
 
@@ -425,3 +434,29 @@ def create_stacked_bar_chart(df, selected_state):
         dragmode=False,
     )
     return fig
+
+
+def trace_names(fig):
+    return [trace.name for trace in fig.data]
+
+
+def assign_arrays(patch, values):
+    # Only the data arrays of a trace, at any depth, change with the filters
+    for key, value in values.items():
+        if isinstance(value, dict):
+            assign_arrays(patch[key], value)
+        elif isinstance(value, (list, tuple, np.ndarray, pd.Series)):
+            patch[key] = value
+
+
+def patch_figure(fig, traces=None):
+    # A Patch turning the figure drawn in the browser into fig, replacing the trace
+    # arrays and the title but leaving its layout and template alone. When traces, the
+    # names of the traces drawn there, differ from those of fig, fig is sent whole
+    if traces is not None and list(traces) != trace_names(fig):
+        return fig
+    patch = Patch()
+    for index, trace in enumerate(fig.to_plotly_json()["data"]):
+        assign_arrays(patch["data"][index], trace)
+    patch["layout"]["title"]["text"] = fig.layout.title.text
+    return patch
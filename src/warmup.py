@@ -0,0 +1,95 @@
+import fcntl
+import json
+import os
+import threading
+import time
+
+import plotly.io.json
+
+import src.data
+from src.cache import cache_config
+from src.metrics import lower_thread_priority, requests_in_flight
+
+# Tab contents precomputed over the full date range once a worker serves: "state" for
+# those of the state analysis tab, "all" for both tabs, "none" for none
+warmup_views = os.environ.get("WARMUP", "state")
+
+# With a cache shared by the workers, the one holding this lock warms it for all
+warmup_lock_path = f"{cache_config['CACHE_DIR'].rstrip(os.sep)}.warmup.lock"
+
+
+def browser_value(value):
+    # The value as the browser sends it back, so that the cache keys match its requests
+    return json.loads(plotly.io.json.to_json_plotly(value))
+
+
+def views():
+    # Inputs of compute_tab_contents for every state and KPI with the default filters,
+    # the default state and KPI first
+    tabs = ["state_analysis_tab"]
+    if warmup_views == "all":
+        tabs.append("metric_analysis_tab")
+    start_date = browser_value(src.data.min_date)
+    end_date = browser_value(src.data.max_date)
+    kpis = list(src.data.kpi_name_function_mapping)
+    states = list(src.data.state_codes)
+    return [
+        (tab, start_date, end_date, None, kpi, state)
+        for tab in tabs
+        for kpi in kpis
+        for state in states
+    ]
+
+
+class CacheWarmer(threading.Thread):
+    # Renders the views at the lowest priority, one at a time while the process is idle
+    def __init__(self, flask_app, render):
+        super().__init__(daemon=True, name="cache-warmer")
+        self.flask_app = flask_app
+        self.render = render
+
+    def run(self):
+        lower_thread_priority()
+
+        # The lock is held until the process exits, so that a worker started in place of
+        # this one takes over
+        if cache_config["CACHE_TYPE"] == "FileSystemCache":
+            self.lock = open(warmup_lock_path, "w")
+            try:
+                fcntl.flock(self.lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.lock.close()
+                return
+        with self.flask_app.app_context():
+            self.warm(views())
+
+    def warm(self, pending):
+        print(f">>> Warming the cache with {len(pending)} views")
+        started = time.perf_counter()
+        step = max(len(pending) // 10, 1)
+        for done, inputs in enumerate(pending, 1):
+            while requests_in_flight():
+                time.sleep(0.1)
+            try:
+                self.render(*inputs)
+            except Exception as error:
+                print(f">>> Warming {inputs} failed: {error!r}")
+            if done % step == 0 or done == len(pending):
+                print(
+                    f">>> Warmed {done}/{len(pending)} views "
+                    f"in {time.perf_counter() - started:.1f}s"
+                )
+
+
+def init_warmup(flask_app, render):
+    # render is compute_tab_contents; the warm-up starts with start_warmup
+    if warmup_views not in ("state", "all"):
+        return
+    flask_app.extensions["cache_warmer"] = lambda: CacheWarmer(flask_app, render)
+
+
+def start_warmup(flask_app):
+    # Called in every worker once it listens
+    warmer = flask_app.extensions.get("cache_warmer")
+    if warmer:
+        warmer().start()
@@ -0,0 +1,29 @@
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+import pytest
+
+# src.data loads the dataset as it is imported, so a synthetic one is written and the
+# app pointed at it before any test module imports the app
+test_dir = tempfile.mkdtemp(prefix="workplace-safety-tests-")
+os.environ["DATASET_PATH"] = os.path.join(test_dir, "dataset.parquet")
+os.environ["CACHE_DIR"] = os.path.join(test_dir, "cache")
+os.environ["METRICS_DIR"] = os.path.join(test_dir, "metrics")
+os.environ["JOBS_DIR"] = os.path.join(test_dir, "jobs")
+os.environ["PREFETCH"] = "0"
+
+from benchmarks.synthetic import write_dataset  # noqa: E402
+
+write_dataset(5_000, os.environ["DATASET_PATH"], seed=1)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(test_dir, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def raw():
+    # The dataset as the original implementation read it
+    return pd.read_parquet(os.environ["DATASET_PATH"])
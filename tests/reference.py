@@ -0,0 +1,263 @@
+# The pandas implementation the app started from, which the tests hold the faster
+# code to. Functions take the dataset as read from the parquet, before enforce_schema
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+kpi_columns = [
+    "incident_rate",
+    "fatality_rate",
+    "lost_workday_rate",
+    "workforce_exposure",
+    "danger_score",
+]
+
+
+def compute_agg_incident_rate(df, column=None):
+    deduplicated = df.drop_duplicates(subset=["state_code", "company_name"])
+    agg_cols = ["state_code", column] if column is not None else ["state_code"]
+    injury_data = (
+        df.groupby(agg_cols, observed=False)
+        .agg(case_number=("case_number", "count"))
+        .reset_index()
+    )
+    company_data = (
+        deduplicated.groupby(agg_cols, observed=False)
+        .agg(total_hours_worked=("total_hours_worked", "sum"))
+        .reset_index()
+    )
+    temp = injury_data.merge(company_data, on=agg_cols, how="left")
+    temp["incident_rate"] = np.where(
+        temp["total_hours_worked"] > 0,
+        temp["case_number"] / temp["total_hours_worked"] * 1e5,
+        0,
+    )
+    return temp[agg_cols + ["incident_rate"]]
+
+
+def compute_agg_fatality_rate(df, column=None):
+    agg_cols = ["state_code", column] if column is not None else ["state_code"]
+    temp = (
+        df.groupby(agg_cols, observed=False)
+        .agg(death=("death", "sum"), case_number=("case_number", "count"))
+        .reset_index()
+    )
+    temp["fatality_rate"] = np.where(
+        temp["case_number"] > 0,
+        temp["death"] / temp["case_number"] * 1e4,
+        0,
+    )
+    return temp[agg_cols + ["fatality_rate"]]
+
+
+def compute_agg_lost_workday_rate(df, column=None):
+    agg_cols = ["state_code", column] if column is not None else ["state_code"]
+    injury_data = (
+        df.groupby(agg_cols, observed=False)
+        .agg(
+            dafw_num_away=("dafw_num_away", "sum"),
+            djtr_num_tr=("djtr_num_tr", "sum"),
+            case_number=("case_number", "count"),
+        )
+        .reset_index()
+    )
+    injury_data["total_lost_days"] = (
+        injury_data["dafw_num_away"] + injury_data["djtr_num_tr"]
+    )
+    injury_data["lost_workday_rate"] = np.where(
+        injury_data["case_number"] > 0,
+        injury_data["total_lost_days"] / injury_data["case_number"],
+        0,
+    )
+    return injury_data[agg_cols + ["lost_workday_rate"]]
+
+
+def compute_workforce_exposure(df, column=None):
+    deduplicated = df.drop_duplicates(subset=["state_code", "company_name"])
+    agg_cols = ["state_code", column] if column is not None else ["state_code"]
+    injury_data = (
+        df.groupby(agg_cols, observed=False)
+        .agg(case_number=("case_number", "count"))
+        .reset_index()
+    )
+    company_data = (
+        deduplicated.groupby(agg_cols, observed=False)
+        .agg(annual_average_employees=("annual_average_employees", "sum"))
+        .reset_index()
+    )
+    temp = injury_data.merge(company_data, on=agg_cols, how="left")
+    temp["workforce_exposure"] = np.where(
+        temp["case_number"] > 0,
+        temp["case_number"] / temp["annual_average_employees"] * 1e2,
+        0,
+    )
+    return temp[agg_cols + ["workforce_exposure"]]
+
+
+def compute_agg_safety_score(df, column=None):
+    keys = ["state_code"] + ([column] if column else [])
+    stats = compute_agg_incident_rate(df, column)
+    stats = stats.merge(compute_agg_fatality_rate(df, column), on=keys, how="left")
+    stats = stats.merge(compute_agg_lost_workday_rate(df, column), on=keys, how="left")
+    stats = stats.merge(compute_workforce_exposure(df, column), on=keys, how="left")
+    stats["danger_score"] = (
+        2.38 * stats["incident_rate"]
+        + 3.33 * stats["fatality_rate"]
+        + 0.37 * stats["lost_workday_rate"]
+        + 1.4 * stats["workforce_exposure"]
+    )
+    return stats
+
+
+kpi_name_function_mapping = {
+    "incident_rate": compute_agg_incident_rate,
+    "fatality_rate": compute_agg_fatality_rate,
+    "lost_workday_rate": compute_agg_lost_workday_rate,
+    "workforce_exposure": compute_workforce_exposure,
+    "danger_score": compute_agg_safety_score,
+}
+
+
+def filter_data(df, start_date, end_date, filter_incident_types):
+    start_date = datetime.fromisoformat(start_date)
+    end_date = datetime.fromisoformat(end_date)
+    use_precomputed = (
+        start_date == df["date_of_incident"].min()
+        and end_date == df["date_of_incident"].max()
+    )
+    if use_precomputed and not filter_incident_types:
+        return df
+    filtered_data = df[
+        (df["date_of_incident"] >= start_date) & (df["date_of_incident"] <= end_date)
+    ]
+    if filter_incident_types:
+        filtered_data = filtered_data[
+            filtered_data["type_of_incident"].isin(filter_incident_types)
+        ]
+    return filtered_data
+
+
+def prepare_radar_data(data, df, state_code):
+    # Scaled by the range of the state KPIs over the whole dataset
+    region_safety_score = compute_agg_safety_score(data)
+    scores = compute_agg_safety_score(df)
+    minimums = region_safety_score[kpi_columns].min()
+    maximums = region_safety_score[kpi_columns].max()
+
+    def scale(values):
+        return [
+            (
+                (values[kpi] - minimums[kpi]) / (maximums[kpi] - minimums[kpi])
+                if maximums[kpi] > minimums[kpi]
+                else 0
+            )
+            for kpi in kpi_columns
+        ]
+
+    values = scores.loc[scores["state_code"] == state_code, kpi_columns].squeeze()
+    mean_values = scores[kpi_columns].mean()
+    return pd.DataFrame(
+        {
+            "kpi": kpi_columns,
+            "value": values.tolist(),
+            "scaled_value": scale(values),
+            "mean_value": mean_values.tolist(),
+            "scaled_mean_value": scale(mean_values),
+        }
+    )
+
+
+def prepare_state_data(df, kpi="incident_rate"):
+    deduplicated = df.drop_duplicates(subset=["state_code", "company_name"])
+    company_data = (
+        deduplicated.groupby("state_code", observed=False)
+        .agg(
+            annual_average_employees_median=("annual_average_employees", "mean"),
+            annual_average_employees_sum=("annual_average_employees", "sum"),
+            total_hours_worked=("total_hours_worked", "mean"),
+        )
+        .reset_index()
+    )
+    injury_data = (
+        df.groupby("state_code", observed=False)
+        .agg(
+            dafw_num_away=("dafw_num_away", "mean"),
+            djtr_num_tr=("djtr_num_tr", "mean"),
+            death=("death", "mean"),
+            case_number=("case_number", "count"),
+        )
+        .reset_index()
+    )
+    aggregated_data = pd.merge(company_data, injury_data, on="state_code", how="inner")
+    aggregated_data["injury_density"] = np.where(
+        aggregated_data["annual_average_employees_median"] > 0,
+        aggregated_data["case_number"]
+        / aggregated_data["annual_average_employees_sum"],
+        0,
+    )
+    return pd.merge(
+        aggregated_data,
+        kpi_name_function_mapping[kpi](df),
+        on="state_code",
+        how="inner",
+    )
+
+
+def prepare_treemap_data(df, state_code, kpi):
+    temp = df[df["state_code"] == state_code]
+    metric_function = kpi_name_function_mapping[kpi]
+    return (
+        temp.query(
+            "soc_description_1 != 'Insufficient info' & soc_description_1 != 'Not assigned'"
+        )
+        .groupby(["soc_description_1", "soc_description_2"], observed=True)
+        .agg(
+            count=("soc_description_1", "size"),
+            metric=(
+                "soc_description_1",
+                lambda group: metric_function(temp.loc[group.index])
+                .query(f"state_code == '{state_code}'")
+                .iloc[0, -1],
+            ),
+        )
+        .reset_index()
+    )
+
+
+def prepare_scatter_plot(df, state):
+    aggregated_data = (
+        df[df["state_code"] == state]
+        .groupby("naics_description_5", observed=True)
+        .agg(
+            {
+                "case_number": "count",
+                "time_started_work": "mean",
+                "time_of_incident": "mean",
+                "establishment_type": lambda x: x.mode().iloc[0],
+            }
+        )
+        .reset_index()
+    )
+    aggregated_data["time_started_work_str"] = aggregated_data[
+        "time_started_work"
+    ].dt.strftime("%H:%M")
+    aggregated_data["time_of_incident_str"] = aggregated_data[
+        "time_of_incident"
+    ].dt.strftime("%H:%M")
+    return aggregated_data
+
+
+def prepare_stacked_bar_chart(df, state):
+    filtered_data = df.query(
+        "state_code == @state & establishment_type != 'Not Stated' & establishment_type != 'Invalid Entry'"
+    )
+    aggregated_data = (
+        filtered_data.groupby(["incident_outcome", "establishment_type"], observed=True)
+        .size()
+        .reset_index(name="count")
+    )
+    pivot_data = aggregated_data.pivot(
+        index="incident_outcome", columns="establishment_type", values="count"
+    ).fillna(0)
+    return pivot_data.div(pivot_data.sum(axis=1), axis=0).reset_index()
@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+
+import flask
+import pytest
+
+import src.background
+import src.profiling
+from src.background import JobManager, background_job, report_progress
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(src.background, "jobs_dir", str(tmp_path))
+    return JobManager()
+
+
+def start(manager, render):
+    job_fn = manager.make_job_fn(background_job(render), progress=True)
+    with flask.Flask(__name__).test_request_context():
+        return manager.call_job_fn("key", job_fn, ["inputs"], {})
+
+
+def wait_until_done(manager, job):
+    deadline = time.monotonic() + 5
+    while manager.job_running(job):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_job_runs_in_a_thread_of_the_worker(manager):
+    def render(inputs):
+        report_progress(1, 2)
+        return (inputs, threading.current_thread().name)
+
+    job = start(manager, render)
+    wait_until_done(manager, job)
+    assert manager.get_progress("key") == [1, 2]
+    assert manager.get_result("key", job) == ("inputs", f"job-{job}")
+
+
+def test_cancelled_job_ends_at_its_next_progress_report(manager):
+    reported, released = threading.Event(), threading.Event()
+    steps = []
+
+    def render(inputs):
+        report_progress(1, 2)
+        steps.append(1)
+        reported.set()
+        released.wait(5)
+        report_progress(2, 2)
+        steps.append(2)
+        return inputs
+
+    job = start(manager, render)
+    assert reported.wait(5)
+    assert manager.job_running(job)
+    manager.terminate_job(job)
+    released.set()
+    wait_until_done(manager, job)
+    # Nothing is stored that a later job of the same inputs could be answered with
+    assert steps == [1]
+    assert manager.get_result("key", job) is manager.UNDEFINED
+
+
+def test_job_runs_under_the_profiler(manager, tmp_path, monkeypatch):
+    monkeypatch.setattr(src.profiling, "profile_dir", str(tmp_path / "profiles"))
+    monkeypatch.setattr(src.profiling, "profile_callbacks", {"render"})
+
+    def render(inputs):
+        return sum(range(1000))
+
+    job = start(manager, render)
+    wait_until_done(manager, job)
+    assert manager.get_result("key", job) == 499500
+    [profile] = os.listdir(tmp_path / "profiles")
+    assert "-render-inputs-" in profile and profile.endswith(".callgrind")
+
+
+def test_progress_outside_a_job_is_ignored():
+    report_progress(1, 2)
+
+
+def test_cached_tab_contents_are_answered_without_a_job(raw, monkeypatch):
+    import application
+
+    client = application.application.test_client()
+    output = next(
+        output
+        for output, entry in application.app.callback_map.items()
+        if getattr(entry.get("callback"), "__name__", None) == "update_tab_contents"
+    )
+    values = [
+        "state_analysis_tab",
+        raw["date_of_incident"].min().isoformat(),
+        raw["date_of_incident"].max().isoformat(),
+        [],
+        "incident_rate",
+        raw["state_code"].value_counts().index[0],
+    ]
+    body = {
+        "output": output,
+        "outputs": [
+            {"id": "content", "property": "children"},
+            {"id": "content-metric-analysis", "property": "children"},
+        ],
+        "inputs": [
+            {**item, "value": value}
+            for item, value in zip(
+                application.app.callback_map[output]["inputs"], values
+            )
+        ],
+        "changedPropIds": ["tabs.value"],
+    }
+
+    launched = []
+    manager = application.app.callback_map[output]["manager"]
+    monkeypatch.setattr(manager, "launched", launched.append)
+
+    job = client.post("/_dash-update-component", json=body).get_json()
+    assert "response" not in job
+    deadline = time.monotonic() + 30
+    while "response" not in job:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+        query = f"cacheKey={job['cacheKey']}&job={job['job']}"
+        polled = client.post(f"/_dash-update-component?{query}", json=body).get_json()
+        job = {**job, **polled}
+    assert set(job["response"]) == {"content", "content-metric-analysis"}
+
+    answer = client.post("/_dash-update-component", json=body).get_json()
+    assert answer == {"multi": True, "response": job["response"]}
+    # Both requests queue the prefetch of their likely next views
+    assert [list(inputs) for inputs in launched] == [values, values]
@@ -0,0 +1,27 @@
+import flask
+
+import src.data
+from src.cache import cache, memoize
+
+
+def test_results_computed_across_a_swap_are_not_stored():
+    app = flask.Flask(__name__)
+    cache.init_app(app, config={"CACHE_TYPE": "SimpleCache"})
+    previous = src.data.active
+    calls = []
+
+    @memoize()
+    def view(swap):
+        calls.append(swap)
+        if swap:
+            src.data.active = src.data.Dataset(previous.state, "swapped")
+        return len(calls)
+
+    with app.app_context():
+        try:
+            assert view(False) == view(False) == 1
+            # Keyed for the previous dataset but computed while another was swapped in
+            assert view(True) == 2
+            assert view(True) == 3
+        finally:
+            src.data.active = previous
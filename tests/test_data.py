@@ -0,0 +1,268 @@
+import pandas as pd
+import pytest
+
+import src.data
+from src.filters import FilterSpec
+from src.schema import enforce_schema
+from tests import reference
+
+
+def seconds_of_day(times):
+    return (times - times.dt.normalize()).dt.total_seconds()
+
+
+def assert_same(new, old):
+    # Equal values, whatever the dtypes, row order and index the frames ended up with.
+    # Mean times are rounded differently, so times compare as seconds into their day
+    keys = [column for column in old.columns if old[column].dtype.kind not in "fiM"]
+    times = [column for column in old.columns if old[column].dtype.kind == "M"]
+    new, old = (
+        frame.astype({key: str for key in keys})
+        .assign(**{time: seconds_of_day(frame[time]) for time in times})
+        .sort_values(keys)
+        .reset_index(drop=True)
+        for frame in (new, old)
+    )
+    pd.testing.assert_frame_equal(
+        new[old.columns], old, check_dtype=False, check_exact=False
+    )
+
+
+@pytest.fixture(scope="module")
+def dates(raw):
+    return (
+        raw["date_of_incident"].min().isoformat(),
+        raw["date_of_incident"].max().isoformat(),
+    )
+
+
+@pytest.fixture(scope="module")
+def states(raw):
+    # The states with the most and the fewest cases
+    counts = raw["state_code"].value_counts()
+    return [counts.index[0], counts[counts > 0].index[-1]]
+
+
+@pytest.mark.parametrize("kpi", list(reference.kpi_name_function_mapping))
+def test_cube_answers_state_kpis(raw, dates, kpi):
+    # Unfiltered, the state views are rolled up from the KPI cube
+    spec = FilterSpec.from_inputs(*dates, kpi=kpi)
+    assert src.data.filter_data(spec) is src.data.data
+    assert_same(
+        src.data.prepare_state_data(spec), reference.prepare_state_data(raw, kpi)
+    )
+
+
+def test_cube_answers_linked_views(raw, dates, states):
+    spec = FilterSpec.from_inputs(*dates)
+    for state in states:
+        view = spec._replace(state=state)
+        assert_same(
+            src.data.prepare_treemap_data(view._replace(kpi="incident_rate")),
+            reference.prepare_treemap_data(raw, state, "incident_rate"),
+        )
+        assert_same(
+            src.data.prepare_stacked_bar_chart(view),
+            reference.prepare_stacked_bar_chart(raw, state),
+        )
+        assert_same(
+            src.data.prepare_radar_data(view),
+            reference.prepare_radar_data(raw, raw, state),
+        )
+
+
+def test_aggregate_measures_counts_company_fields_once():
+    # Company 0 is a chain of establishments reporting three cases in two SOC groups,
+    # company 1 reports a single one. The rows are in date order; the first row of a
+    # company in the dataset files supplies its hours and employees
+    df = pd.DataFrame(
+        {
+            "state_code": ["OH", "OH", "OH", "OH"],
+            "soc_description_1": ["A", "A", "B", "A"],
+            "soc_description_2": ["a", "a", "b", "a"],
+            "company_id": [0, 0, 0, 1],
+            "source_row": [2, 0, 1, 3],
+            "total_hours_worked": [900, 1000, 700, 300],
+            "annual_average_employees": [9, 10, 7, 2],
+            "case_number": ["1", "2", "3", None],
+            "death": [True, False, False, False],
+            "dafw_num_away": [5, 0, 2, 0],
+            "djtr_num_tr": [0, 3, 0, 0],
+        }
+    )
+    totals = src.data.aggregate_measures(
+        df, ["state_code"], levels=tuple(src.data.company_levels)
+    ).iloc[0]
+    assert totals["case_number"] == 3
+    assert totals["death"] == 1
+    assert totals["dafw_num_away"] + totals["djtr_num_tr"] == 10
+    assert totals["companies"] == 2
+    assert totals["total_hours_worked"] == 1300
+    assert totals["annual_average_employees"] == 12
+    # Per SOC group, company 0 counts once in A and once in B, each time with the
+    # figures of its first row in that group
+    assert totals["soc_companies"] == 3
+    assert totals["soc_total_hours_worked"] == 2000
+    assert totals["soc_annual_average_employees"] == 19
+
+
+@pytest.mark.parametrize("column", [None, "incident_outcome", "type_of_incident"])
+def test_kpi_functions_match_reference(raw, dates, column):
+    types = ["Injury", "Respiratory condition"]
+    spec = FilterSpec.from_inputs(dates[0], "2023-06-30T00:00:00", types)
+    df = src.data.filter_data(spec)
+    old_df = reference.filter_data(raw, spec.start_date, spec.end_date, types)
+    for kpi, function in src.data.kpi_name_function_mapping.items():
+        assert_same(
+            function(df, column),
+            reference.kpi_name_function_mapping[kpi](old_df, column),
+        )
+
+
+filter_cases = [
+    ("2023-01-01T00:00:00", "2023-12-31T00:00:00", []),
+    ("2023-03-01T00:00:00", "2023-05-31T00:00:00", []),
+    ("2023-01-01T00:00:00", "2023-12-31T00:00:00", ["Injury"]),
+    ("2023-02-15T00:00:00", "2023-08-01T00:00:00", ["Poisoning", "Skin disorder"]),
+]
+
+
+@pytest.mark.parametrize("start_date, end_date, incident_types", filter_cases)
+def test_filter_data_matches_reference(raw, start_date, end_date, incident_types):
+    spec = FilterSpec.from_inputs(start_date, end_date, incident_types)
+    old = reference.filter_data(raw, start_date, end_date, incident_types)
+    assert sorted(src.data.filter_data(spec)["case_number"]) == sorted(
+        old["case_number"]
+    )
+
+
+@pytest.mark.parametrize("start_date, end_date, incident_types", filter_cases)
+def test_filtered_views_match_reference(
+    raw, states, start_date, end_date, incident_types
+):
+    spec = FilterSpec.from_inputs(start_date, end_date, incident_types)
+    df = reference.filter_data(raw, start_date, end_date, incident_types)
+    for kpi in ["incident_rate", "danger_score"]:
+        assert_same(
+            src.data.prepare_state_data(spec._replace(kpi=kpi)),
+            reference.prepare_state_data(df, kpi),
+        )
+    for state in states:
+        view = spec._replace(state=state)
+        assert_same(
+            src.data.prepare_radar_data(view),
+            reference.prepare_radar_data(raw, df, state),
+        )
+        assert_same(
+            src.data.prepare_treemap_data(view._replace(kpi="incident_rate")),
+            reference.prepare_treemap_data(df, state, "incident_rate"),
+        )
+        assert_same(
+            src.data.prepare_stacked_bar_chart(view),
+            reference.prepare_stacked_bar_chart(df, state),
+        )
+        # The hover labels of mean times a nanosecond apart can differ by a minute
+        labels = ["time_started_work_str", "time_of_incident_str"]
+        assert_same(
+            src.data.prepare_scatter_plot(view).drop(columns=labels),
+            reference.prepare_scatter_plot(df, state).drop(columns=labels),
+        )
+
+
+def sorted_frame(frame, keys):
+    return (
+        frame.astype({key: str for key in keys})
+        .sort_values(keys)
+        .reset_index(drop=True)
+    )
+
+
+def test_append_state_matches_rebuild(raw):
+    # The release holds new companies as well as earlier rows of known ones
+    base, release = raw.iloc[:4000], raw.iloc[4000:]
+    appended = src.data.append_state(
+        src.data.build_state(enforce_schema(base)), release
+    )
+    rebuilt = src.data.build_state(enforce_schema(raw))
+
+    pd.testing.assert_frame_equal(
+        sorted_frame(appended["kpi_cube"], src.data.cube_dimensions),
+        sorted_frame(rebuilt["kpi_cube"], src.data.cube_dimensions),
+        check_dtype=False,
+    )
+    assert_same(appended["region_safety_score"], rebuilt["region_safety_score"])
+    for name in ["min_metric_values", "max_metric_values", "mean_metric_values"]:
+        assert appended[name] == pytest.approx(rebuilt[name]), name
+    for name in ["incident_types", "state_codes", "min_date", "max_date"]:
+        assert appended[name] == rebuilt[name], name
+
+    # Companies keep their ids, so compare them by name
+    keys = ["state_code", "company_name"]
+    assert_same(appended["companies"], rebuilt["companies"])
+    assert sorted(appended["data"]["case_number"]) == sorted(raw["case_number"])
+    for state in (appended, rebuilt):
+        data, companies = state["data"], state["companies"]
+        assert (
+            data[keys].astype(str).to_numpy()
+            == companies.loc[data["company_id"], keys].astype(str).to_numpy()
+        ).all()
+        assert data["date_of_incident"].is_monotonic_increasing
+        for incident_type, rows in state["incident_type_rows"].items():
+            assert (data["type_of_incident"].iloc[rows] == incident_type).all()
+
+
+def test_swap_serves_the_new_dataset(raw, dates):
+    # Views computed before a swap are neither served nor stored for the new dataset
+    previous = src.data.active
+    spec = FilterSpec.from_inputs(dates[0], "2023-06-30T00:00:00")
+    before = src.data.filter_data(spec)
+    half = src.data.build_state(enforce_schema(raw.iloc[:2500]))
+    try:
+        src.data.activate_state(half, "half")
+        after = src.data.filter_data(spec)
+        assert len(after) < len(before)
+        assert src.data.prepare_state_data(spec)["case_number"].sum() == len(after)
+    finally:
+        src.data.active = previous
+    assert src.data.filter_data(spec) is before
+
+
+def drilldown_rows(raw, selection):
+    # Rows of the selections, filtered the way the original linked callbacks did
+    rows = raw
+    for field, value in selection.items():
+        if field.startswith("time_"):
+            hours = rows[field].dt.hour + rows[field].dt.minute / 60
+            rows = rows[(hours >= value[0]) & (hours <= value[1])]
+        else:
+            rows = rows[rows[field] == value]
+    return rows
+
+
+@pytest.mark.parametrize(
+    "selection",
+    [
+        {"incident_outcome": "Days away from work (DAFW)"},
+        {"time_started_work": (6.0, 9.5), "time_of_incident": (8.25, 14.0)},
+        {
+            "incident_outcome": "Other recordable case",
+            "time_of_incident": (10.0, 16.0),
+        },
+    ],
+)
+def test_drilldown_selections_match_reference(raw, dates, states, selection):
+    spec = FilterSpec.from_inputs(*dates, **selection)
+    df = drilldown_rows(raw, selection)
+    assert sorted(src.data.filter_data(spec)["case_number"]) == sorted(
+        df["case_number"]
+    )
+    for state in states:
+        view = spec._replace(state=state)
+        assert_same(
+            src.data.prepare_treemap_data(view._replace(kpi="incident_rate")),
+            reference.prepare_treemap_data(df, state, "incident_rate"),
+        )
+        assert_same(
+            src.data.prepare_stacked_bar_chart(view),
+            reference.prepare_stacked_bar_chart(df, state),
+        )
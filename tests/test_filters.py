@@ -0,0 +1,76 @@
+from src.filters import FilterSpec, relayout_range
+
+
+def test_equivalent_inputs_share_a_spec():
+    spec = FilterSpec.from_inputs(
+        "2023-01-01", "2023-06-30T00:00:00", ["Injury", "Poisoning", "Injury"]
+    )
+    assert spec == FilterSpec.from_inputs(
+        "2023-01-01T00:00:00", "2023-06-30", ["Poisoning", "Injury"]
+    )
+    assert spec.start_date == "2023-01-01T00:00:00"
+    assert spec.incident_types == ("Injury", "Poisoning")
+    assert repr(spec) == repr(
+        FilterSpec.from_inputs("2023-01-01", "2023-06-30", ("Poisoning", "Injury"))
+    )
+
+
+def test_no_incident_types_is_an_empty_tuple():
+    assert FilterSpec.from_inputs("2023-01-01", "2023-06-30").incident_types == ()
+    assert FilterSpec.from_inputs("2023-01-01", "2023-06-30", None).incident_types == ()
+
+
+def test_row_and_base_filters_drop_view_fields():
+    spec = FilterSpec.from_inputs(
+        "2023-01-01",
+        "2023-06-30",
+        state="OH",
+        kpi="incident_rate",
+        incident_outcome="Death",
+        time_of_incident=(8.0, 12.0),
+    )
+    assert spec.row_filters == FilterSpec.from_inputs(
+        "2023-01-01",
+        "2023-06-30",
+        incident_outcome="Death",
+        time_of_incident=(8.0, 12.0),
+    )
+    assert spec.base_filters == FilterSpec.from_inputs("2023-01-01", "2023-06-30")
+
+
+def test_views_are_not_filtered_by_their_own_selections():
+    spec = FilterSpec.from_inputs("2023-01-01", "2023-06-30", state="OH")
+    selection = {
+        "incident_outcome": "Death",
+        "soc_description_1": "Healthcare",
+        "soc_description_2": None,
+        "time_started_work": [6.0, 9.0],
+        "time_of_incident": None,
+    }
+
+    bar = spec.for_view(selection, "bar")
+    assert bar.incident_outcome is None
+    assert bar.soc_description_1 == "Healthcare"
+    assert bar.time_started_work == (6.0, 9.0)
+
+    treemap = spec.for_view(selection, "treemap")
+    assert treemap.incident_outcome == "Death"
+    assert treemap.soc_description_1 is None
+
+    scatter = spec.for_view(selection, "scatter")
+    assert scatter.incident_outcome == "Death"
+    assert scatter.time_started_work is None
+    assert scatter.state == "OH"
+
+    # Lists from the browser become tuples, so that the spec stays hashable
+    hash(bar)
+    assert spec.for_view(None, "bar") == spec
+
+
+def test_relayout_range():
+    assert relayout_range({"xaxis.range[0]": 6, "xaxis.range[1]": "9.5"}, "xaxis") == (
+        6.0,
+        9.5,
+    )
+    assert relayout_range({"xaxis.autorange": True}, "xaxis") is None
+    assert relayout_range({"xaxis.range[0]": 6}, "yaxis") is None
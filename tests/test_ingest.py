@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ingest import SeenRows, drop_seen, partition_name
+
+
+def test_drop_seen_matches_drop_duplicates():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "company_name": rng.choice(["A", "B", "C"], 500),
+            "case_number": rng.integers(0, 40, 500).astype(str),
+            "total_hours_worked": rng.choice([1000.0, 2000.0, np.nan], 500),
+        },
+        index=pd.RangeIndex(500, name="id"),
+    )
+    seen = SeenRows()
+    kept = [drop_seen(df.iloc[start : start + 64], seen) for start in range(0, 500, 64)]
+    pd.testing.assert_frame_equal(pd.concat(kept), df.drop_duplicates())
+    assert len(seen) == len(df.drop_duplicates())
+    for run in seen.runs:
+        assert (run[1:] > run[:-1]).all()
+
+
+def test_duplicates_of_rows_from_earlier_chunks_are_dropped():
+    # Every chunk repeats a row of each earlier chunk, in runs that were merged since
+    rows = [pd.DataFrame({"case_number": [f"{i}-a", f"{i}-b"]}) for i in range(20)]
+    seen = SeenRows()
+    for i, chunk in enumerate(rows):
+        repeats = pd.DataFrame({"case_number": [f"{j}-a" for j in range(i)]})
+        assert drop_seen(pd.concat([repeats, chunk]), seen).equals(chunk)
+    assert len(seen) == 40
+    # The runs stay few, with sizes of distinct powers of two
+    assert [len(run) for run in seen.runs] == [32, 8]
+
+
+def test_chunks_without_new_rows():
+    df = pd.DataFrame({"case_number": ["1", "2"]})
+    seen = SeenRows()
+    assert len(drop_seen(df, seen)) == 2
+    assert drop_seen(df.iloc[::-1], seen).empty and len(seen) == 2
+
+
+def test_partitions_sort_in_the_order_they_were_added(tmp_path, monkeypatch):
+    import src.data
+
+    monkeypatch.setattr(src.data, "partitions_path", str(tmp_path))
+    assert partition_name("releases/2024.csv") == "0001-2024.parquet"
+    (tmp_path / "0001-2024.parquet").touch()
+    assert partition_name("2025.csv") == "0002-2025.parquet"
+    with pytest.raises(ValueError):
+        partition_name("other/2024.csv")
@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+
+import pandas as pd
+import pytest
+
+import src.metrics as metrics
+
+
+@pytest.fixture
+def empty_metrics(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "metrics_dir", str(tmp_path))
+    monkeypatch.setattr(metrics, "totals", {})
+    monkeypatch.setattr(metrics, "events", {})
+    return tmp_path
+
+
+def sample(text, name):
+    # Value of the sample with this name and labels
+    (line,) = [line for line in text.splitlines() if line.startswith(name + " ")]
+    return float(line.split()[-1])
+
+
+def test_metrics_text_adds_up_the_workers(empty_metrics):
+    for seconds in [0.003, 0.02, 0.4]:
+        metrics.observe(
+            {
+                "stage": "prepare_treemap_data",
+                "cache": "miss",
+                "seconds": seconds,
+                "rows_scanned": 100,
+                "rows_returned": 10,
+            }
+        )
+    metrics.count_event("prefetch", "computed")
+    metrics.count_event("prefetch", "computed")
+    metrics.count_event("prefetch", "used")
+
+    # The totals of another worker on the host
+    counts = [0] * len(metrics.buckets) + [1, 2.0, 5, 1]
+    counts[metrics.buckets.index(2.5)] = 1
+    with open(empty_metrics / "0.json", "w") as file:
+        json.dump(
+            {
+                "totals": [["prepare_treemap_data", "miss", counts]],
+                "events": [["prefetch", "computed", 2]],
+            },
+            file,
+        )
+
+    text = metrics.metrics_text()
+    labels = 'stage="prepare_treemap_data",cache="miss"'
+    assert sample(text, f'dashboard_stage_seconds_bucket{{{labels},le="0.005"}}') == 1
+    assert sample(text, f'dashboard_stage_seconds_bucket{{{labels},le="0.025"}}') == 2
+    assert sample(text, f'dashboard_stage_seconds_bucket{{{labels},le="0.5"}}') == 3
+    assert sample(text, f'dashboard_stage_seconds_bucket{{{labels},le="2.5"}}') == 4
+    assert sample(text, f'dashboard_stage_seconds_bucket{{{labels},le="+Inf"}}') == 4
+    assert sample(text, f"dashboard_stage_seconds_count{{{labels}}}") == 4
+    assert sample(text, f"dashboard_stage_seconds_sum{{{labels}}}") == pytest.approx(
+        2.423
+    )
+    assert sample(text, f"dashboard_stage_rows_scanned_total{{{labels}}}") == 305
+    assert sample(text, f"dashboard_stage_rows_returned_total{{{labels}}}") == 31
+    assert sample(text, 'dashboard_prefetch_total{outcome="computed"}') == 4
+    assert sample(text, "dashboard_prefetch_hit_ratio") == 0.25
+
+    # Every metric is declared once, before its samples
+    for name in [
+        "dashboard_stage_seconds",
+        "dashboard_stage_rows_scanned_total",
+        "dashboard_prefetch_total",
+    ]:
+        assert text.count(f"# TYPE {name} ") == 1
+        assert text.index(f"# TYPE {name} ") < text.index(f"\n{name}")
+
+
+def test_timed_records_rows_and_nesting(empty_metrics, monkeypatch):
+    records = []
+    monkeypatch.setattr(metrics, "observe", records.append)
+
+    @metrics.timed(cache="hit")
+    def inner(df):
+        return df.head(2)
+
+    @metrics.timed()
+    def outer(df):
+        return inner(df)
+
+    outer(pd.DataFrame({"a": range(5)}))
+    assert [record["stage"] for record in records] == ["inner", "outer"]
+    assert records[0]["parent"] == "outer"
+    assert records[0]["cache"] == "hit"
+    assert records[1]["cache"] == "none"
+    assert records[0]["rows_scanned"] == 5
+    assert records[0]["rows_returned"] == 2
+
+
+def test_spans_of_concurrent_threads_are_all_counted(empty_metrics, monkeypatch):
+    # Every outermost span rewrites the totals file; no write may fail another thread
+    monkeypatch.setattr(metrics, "spans", threading.local())
+    failures = []
+
+    def work():
+        try:
+            for _ in range(200):
+                with metrics.span("prepare_state_data", cache="miss"):
+                    pass
+        except Exception as error:
+            failures.append(error)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert failures == []
+    assert [name for name in os.listdir(empty_metrics)] == [f"{os.getpid()}.json"]
+    labels = 'stage="prepare_state_data",cache="miss"'
+    text = metrics.metrics_text()
+    assert sample(text, f"dashboard_stage_seconds_count{{{labels}}}") == 1600
+
+
+def test_failed_metrics_write_does_not_fail_the_span(empty_metrics, monkeypatch):
+    monkeypatch.setattr(metrics, "metrics_dir", str(empty_metrics / "file"))
+    (empty_metrics / "file").write_text("")
+    with metrics.span("prepare_state_data"):
+        pass
@@ -0,0 +1,17 @@
+import os
+
+import src.profiling as profiling
+
+
+def test_profiles_of_equal_requests_get_their_own_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "profile_dir", str(tmp_path))
+    inputs = ["state_analysis_tab", "2023-01-01T00:00:00", None, "OH"]
+    paths = {
+        profiling.profile_path("update_tab_contents", inputs, "callgrind")
+        for _ in range(3)
+    }
+    assert len(paths) == 3
+    for path in paths:
+        name = os.path.basename(path)
+        assert f"-{os.getpid()}-" in name
+        assert "update_tab_contents" in name and name.endswith(".callgrind")
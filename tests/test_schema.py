@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.schema import column_dtypes, enforce_schema, memory_report
+
+
+def test_enforced_types(raw):
+    df = enforce_schema(raw)
+    assert list(df.columns) == list(column_dtypes)
+    for column, dtype in column_dtypes.items():
+        if dtype == "category":
+            assert isinstance(df[column].dtype, pd.CategoricalDtype), column
+            assert df[column].cat.categories.dtype == object, column
+        else:
+            assert df[column].dtype == pd.api.types.pandas_dtype(dtype), column
+    assert (df["case_number"].astype(str) == raw["case_number"]).all()
+    assert (df["company_name"].astype(str) == raw["company_name"]).all()
+    assert (df["total_hours_worked"] == raw["total_hours_worked"]).all()
+
+
+def test_times_become_minutes_of_the_day(raw):
+    df = raw.head(3).copy()
+    df["time_started_work"] = pd.to_datetime(
+        ["1900-01-01 07:30:00", "1900-01-01 23:59:59", None]
+    )
+    minutes = enforce_schema(df)["start_minute"]
+    assert minutes.tolist() == [450, 1439, -1]
+    assert minutes.dtype == np.int16
+
+
+def test_arrow_strings_become_object_categories(raw):
+    df = raw.head(10).astype({"state_code": "string[pyarrow]"})
+    categories = enforce_schema(df)["state_code"].cat.categories
+    assert categories.dtype == object
+    assert set(categories) == set(raw["state_code"].head(10))
+
+
+def test_values_that_do_not_fit_are_rejected(raw):
+    df = raw.head(3).astype({"dafw_num_away": np.int64})
+    df.loc[df.index[0], "dafw_num_away"] = 40_000
+    with pytest.raises(ValueError, match="dafw_num_away"):
+        enforce_schema(df)
+
+
+def test_missing_columns_are_rejected(raw):
+    with pytest.raises(ValueError, match="death"):
+        enforce_schema(raw.drop(columns=["death"]))
+
+
+def test_memory_report(raw):
+    report = memory_report(raw, enforce_schema(raw))
+    assert report.loc["total", "after"] < report.loc["total", "before"]
+    assert report.loc["start_minute", "before"] == 0
@@ -0,0 +1,85 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import src.data
+from src.snapshot import read_snapshot, snapshot_frames, write_snapshot
+
+
+def assert_same_state(actual, expected):
+    assert actual.keys() == expected.keys()
+    for name, value in expected.items():
+        if name in snapshot_frames:
+            pd.testing.assert_frame_equal(actual[name], value)
+        elif name == "incident_type_rows":
+            assert actual[name].keys() == value.keys()
+            for incident_type, rows in value.items():
+                np.testing.assert_array_equal(actual[name][incident_type], rows)
+        else:
+            assert actual[name] == value, name
+
+
+def test_snapshot_round_trip(tmp_path):
+    state = src.data.build_state(src.data.read_dataset(src.data.dataset_files()))
+    path = str(tmp_path / "snapshot")
+    write_snapshot(state, path, "version-1")
+    assert_same_state(read_snapshot(path, "version-1"), state)
+
+    # Rewriting replaces the snapshot as a whole
+    write_snapshot(state, path, "version-2")
+    assert_same_state(read_snapshot(path, "version-2"), state)
+
+
+def test_stale_or_missing_snapshot_is_ignored(tmp_path):
+    path = str(tmp_path / "snapshot")
+    assert read_snapshot(path, "version-1") is None
+    write_snapshot(src.data.state, path, "version-1")
+    assert read_snapshot(path, "version-2") is None
+
+
+def test_rewrite_swaps_the_link_and_removes_the_previous_snapshot(tmp_path):
+    path = str(tmp_path / "snapshot")
+    # A snapshot written before they were linked is a plain directory
+    os.makedirs(path)
+    write_snapshot(src.data.state, path, "version-1")
+    first = os.path.realpath(path)
+    write_snapshot(src.data.state, path, "version-2")
+    assert os.path.islink(path) and not os.path.exists(first)
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        ["snapshot", os.path.basename(os.path.realpath(path))]
+    )
+
+
+def test_snapshot_replaced_while_read_counts_as_unchanged(tmp_path):
+    path = str(tmp_path / "snapshot")
+    write_snapshot(src.data.state, path, "version-1")
+    stop, results, errors = threading.Event(), [], []
+
+    def read():
+        while not stop.is_set():
+            try:
+                results.append(read_snapshot(path, "version-1"))
+            except Exception as error:
+                errors.append(error)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    for _ in range(5):
+        write_snapshot(src.data.state, path, "version-1")
+    stop.set()
+    reader.join()
+    assert errors == []
+    assert any(state is not None for state in results)
+    for state in results:
+        if state is not None:
+            assert len(state["data"]) == len(src.data.state["data"])
+
+    # A snapshot that is missing or only partly there is no snapshot
+    partial = tmp_path / "partial"
+    partial.mkdir()
+    with open(os.path.realpath(path) + "/manifest.json") as file:
+        (partial / "manifest.json").write_text(file.read())
+    assert read_snapshot(str(partial), "version-1") is None
+    assert read_snapshot(str(tmp_path / "missing"), "version-1") is None